@@ -4,7 +4,9 @@ Pydantic models for type validation
 """
 from pydantic import BaseModel, Field, HttpUrl, validator
 from typing import Optional, List, Dict, Any
+from typing_extensions import Annotated
 from datetime import datetime
+import msgspec
 
 
 class URLAnalysisRequest(BaseModel):
@@ -23,6 +25,26 @@ class URLAnalysisRequest(BaseModel):
         return v
 
 
+class URLAnalysisRequestStruct(msgspec.Struct, frozen=True):
+    """
+    msgspec mirror of URLAnalysisRequest, decoded directly from the request
+    body on the hot /analyze/url path (URLAnalysisRequest documents it)
+    """
+    url: Annotated[str, msgspec.Meta(min_length=10, max_length=2048)]
+    page_title: Optional[str] = None
+    page_text: Optional[str] = None
+    css_colors: Optional[List[str]] = None
+    user_id: Optional[str] = None
+    
+    def __post_init__(self):
+        """Validate URL format"""
+        if not self.url.startswith(('http://', 'https://')):
+            raise ValueError('URL must start with http:// or https://')
+
+
+url_analysis_request_decoder = msgspec.json.Decoder(URLAnalysisRequestStruct)
+
+
 class ThreatReason(BaseModel):
     """Individual threat reason"""
     factor: str = Field(..., description="Threat factor description")
@@ -39,7 +61,7 @@ class URLAnalysisResponse(BaseModel):
     confidence: float = Field(..., description="Confidence in prediction (0-1)", ge=0, le=1)
     recommendation: str = Field(..., description="Recommended action: allow, warn, block")
     analysis: Dict[str, Any] = Field(..., description="Detailed analysis breakdown")
-    timestamp: str = Field(..., description="Analysis timestamp (ISO format)")
+    timestamp: datetime = Field(..., description="Analysis timestamp (UTC, ISO format)")
 
 
 class EmailAnalysisRequest(BaseModel):
@@ -65,7 +87,7 @@ class EmailAnalysisResponse(BaseModel):
     sender_spoofing: bool = Field(..., description="Sender spoofing detected?")
     urgency_detected: bool = Field(..., description="Urgency keywords detected?")
     recommendation: str = Field(..., description="Recommended action")
-    timestamp: str
+    timestamp: datetime
 
 
 class DomainReputationResponse(BaseModel):
@@ -74,9 +96,9 @@ class DomainReputationResponse(BaseModel):
     is_malicious: bool
     threat_score: int
     sources: Dict[str, Any]
-    first_seen: Optional[str]
-    last_seen: Optional[str]
-    timestamp: str
+    first_seen: Optional[datetime]
+    last_seen: Optional[datetime]
+    timestamp: datetime
 
 
 class HealthResponse(BaseModel):
@@ -2,9 +2,11 @@
 API v1 Router
 """
 from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
 from api.v1 import routes
 
-router = APIRouter()
+# orjson-backed responses for all v1 endpoints (faster than stdlib json)
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # Include all v1 routes
 router.include_router(routes.router, tags=["Analysis"])
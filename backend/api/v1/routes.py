@@ -2,14 +2,18 @@
 API v1 Routes
 Main API endpoints for phishing detection
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from fastapi.responses import ORJSONResponse, Response
+from typing import Optional, Dict, Any
 import logging
 import asyncio
-from datetime import datetime
+from functools import lru_cache
+from datetime import datetime, timezone
+import msgspec
 
 from api.models import (
     URLAnalysisRequest,
+    url_analysis_request_decoder,
     URLAnalysisResponse,
     EmailAnalysisRequest,
     EmailAnalysisResponse,
@@ -23,14 +27,59 @@ from threatintel import threat_intelligence
 from ml.model import ml_model
 from scoring.composite_scorer import composite_scorer
 from utils.cache import threat_cache
+from utils.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Email analysis constants
+URGENCY_KEYWORDS = (
+    'urgent', 'immediate', 'suspend', 'locked', 'verify', 'confirm',
+    'expire', 'within 24 hours', 'act now', 'limited time', 'unusual activity'
+)
+SUSPICIOUS_EXT = ('.exe', '.scr', '.bat', '.cmd', '.com', '.pif', '.vbs', '.js')
+SPOOF_BRANDS = ('paypal', 'microsoft', 'google', 'apple', 'amazon', 'facebook')
+
+urgency_matcher = KeywordMatcher(URGENCY_KEYWORDS)
+spoof_brand_matcher = KeywordMatcher(SPOOF_BRANDS)
+
+
+def _email_verdict(score: int) -> tuple:
+    """Map an email threat score to (risk_level, recommendation, is_phishing)"""
+    if score >= 85:
+        return 'critical', 'block', True
+    if score >= 60:
+        return 'dangerous', 'block', True
+    if score >= 30:
+        return 'suspicious', 'warn', False
+    return 'safe', 'allow', False
+
+
+# Email verdicts indexed by threat score (0-100)
+EMAIL_RISK_LUT = tuple(_email_verdict(score) for score in range(101))
 
-@router.post("/analyze/url", response_model=URLAnalysisResponse)
-async def analyze_url(request: URLAnalysisRequest):
+
+@lru_cache(maxsize=4096)
+def _score_link(link: str) -> dict:
+    """Quick heuristic check for a single email link (memoized across emails)"""
+    link_features = url_feature_extractor.extract_all_features(link)
+    return heuristic_scorer.calculate_score(link_features)
+
+
+# Results are built internally, so response models are only advertised in the
+# OpenAPI schema and not re-validated on the way out
+@router.post(
+    "/analyze/url",
+    responses={200: {"model": URLAnalysisResponse}},
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": URLAnalysisRequest.model_json_schema()}}
+        }
+    }
+)
+async def analyze_url(http_request: Request):
     """
     Analyze URL for phishing threats
     
@@ -43,26 +92,62 @@ async def analyze_url(request: URLAnalysisRequest):
     
     Returns threat score (0-100) with detailed explanation
     """
+    # Decode + validate the body with msgspec (schema: URLAnalysisRequest)
+    try:
+        request = url_analysis_request_decoder.decode(await http_request.body())
+    except msgspec.ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+    
     try:
         url = request.url
         logger.info(f"Analyzing URL: {url}")
         
-        # Check cache first
-        cached_result = threat_cache.get_url_analysis(url)
-        if cached_result:
+        # Check cache first (served as the stored JSON, no decode/re-encode)
+        cached_bytes = threat_cache.get_url_analysis_bytes(url)
+        if cached_bytes:
             logger.info(f"Cache hit for {url}")
-            return URLAnalysisResponse(**cached_result)
+            return Response(content=cached_bytes, media_type="application/json")
+        
+        # Allow/deny prefilter: exact matches skip the full analysis pipeline
+        if threat_intelligence.is_known_phishing(url):
+            logger.info(f"Prefilter deny (OpenPhish): {url}")
+            return ORJSONResponse(content=composite_scorer.build_prefilter_result(
+                threat_score=95,
+                is_phishing=True,
+                prefilter='denylist',
+                reasons=[{
+                    'factor': 'Listed in OpenPhish feed (confirmed phishing)',
+                    'severity': 'critical',
+                    'weight': 95,
+                    'source': 'threat_intelligence'
+                }]
+            ))
+        if lookalike_detector.is_trusted_host(url):
+            logger.info(f"Prefilter allow (trusted host): {url}")
+            return ORJSONResponse(content=composite_scorer.build_prefilter_result(
+                threat_score=0,
+                is_phishing=False,
+                prefilter='allowlist'
+            ))
         
-        # Extract URL features
+        # Extract URL features (SSL + WHOIS probes run concurrently off the event loop)
         logger.debug("Extracting URL features...")
-        url_features = url_feature_extractor.extract_all_features(url)
+        url_features = await url_feature_extractor.extract_all_features_async(url)
+        
+        # Reuse the feature extractor's domain parse when it succeeded
+        if 'domain_label' in url_features:
+            lookalike_task = asyncio.to_thread(lookalike_detector.detect_lookalike_domain, url_features['domain_label'])
+        else:
+            lookalike_task = asyncio.to_thread(lookalike_detector.detect_lookalike, url)
         
         # Run all analyses in parallel
         logger.debug("Running parallel analyses...")
         heuristic_result, lookalike_result, threat_intel_result, ml_result = await asyncio.gather(
             asyncio.to_thread(heuristic_scorer.calculate_score, url_features),
-            asyncio.to_thread(lookalike_detector.detect_lookalike, url),
-            asyncio.to_thread(threat_intelligence.check_all, url),
+            lookalike_task,
+            threat_intelligence.check_all_async(url),
             asyncio.to_thread(ml_model.predict, url_features)
         )
         
@@ -90,12 +175,12 @@ async def analyze_url(request: URLAnalysisRequest):
             brand_impersonation_details=brand_impersonation_result
         )
         
-        # Cache result
-        threat_cache.set_url_analysis(url, result)
+        # Cache result (written by the cache's background writer)
+        threat_cache.queue_url_analysis(url, result)
         
         logger.info(f"Analysis complete: {url} - Score: {result['threat_score']}, Risk: {result['risk_level']}")
         
-        return URLAnalysisResponse(**result)
+        return ORJSONResponse(content=result)
     
     except Exception as e:
         logger.error(f"Error analyzing URL {request.url}: {e}", exc_info=True)
@@ -109,7 +194,107 @@ async def analyze_url(request: URLAnalysisRequest):
         )
 
 
-@router.post("/analyze/email", response_model=EmailAnalysisResponse)
+def _analyze_email_sync(request: EmailAnalysisRequest) -> Dict[str, Any]:
+    """Run the CPU-bound email checks (called from a worker thread)"""
+    reasons = []
+    suspicious_links = []
+    threat_score = 0
+    
+    # Check sender spoofing
+    sender_spoofing = False
+    if request.sender_name and request.sender:
+        sender_domain = request.sender.split('@')[-1].lower()
+        sender_name_lower = request.sender_name.lower()
+        
+        # Check if display name mentions a brand but email domain doesn't match
+        mentioned_brands = spoof_brand_matcher.find(sender_name_lower)
+        for brand in SPOOF_BRANDS:
+            if brand in mentioned_brands and brand not in sender_domain:
+                sender_spoofing = True
+                threat_score += 30
+                reasons.append({
+                    'factor': f"Sender spoofing: Display name mentions '{brand}' but domain is '{sender_domain}'",
+                    'severity': 'critical',
+                    'weight': 30,
+                    'source': 'sender_analysis'
+                })
+                break
+    
+    # Check for urgency keywords
+    urgency_detected = False
+    combined_text = f"{request.subject} {request.body}".lower()
+    
+    urgency_count = urgency_matcher.count(combined_text)
+    if urgency_count >= 2:
+        urgency_detected = True
+        threat_score += 20
+        reasons.append({
+            'factor': f"Urgency tactics detected ({urgency_count} urgency keywords)",
+            'severity': 'high',
+            'weight': 20,
+            'source': 'content_analysis'
+        })
+    
+    # Analyze links (each unique link scored once)
+    if request.links:
+        link_scores = {}
+        for link in dict.fromkeys(request.links):
+            try:
+                link_scores[link] = _score_link(link)
+            except Exception as e:
+                logger.warning(f"Error analyzing link {link}: {e}")
+        for link in request.links:
+            link_heuristic = link_scores.get(link)
+            if link_heuristic is None:
+                continue
+            
+            if link_heuristic['score'] >= 50:
+                suspicious_links.append(link)
+                threat_score += 15
+                reasons.append({
+                    'factor': f"Suspicious link detected: {link[:50]}...",
+                    'severity': 'high',
+                    'weight': 15,
+                    'source': 'link_analysis'
+                })
+    
+    # Check attachments
+    if request.attachments:
+        for attachment in request.attachments:
+            filename = attachment.get('filename', '').lower()
+            if filename.endswith(SUSPICIOUS_EXT):
+                threat_score += 25
+                reasons.append({
+                    'factor': f"Suspicious attachment: {filename}",
+                    'severity': 'critical',
+                    'weight': 25,
+                    'source': 'attachment_analysis'
+                })
+    
+    # Normalize score
+    threat_score = min(threat_score, 100)
+    phishing_probability = threat_score / 100
+    
+    # Determine risk level
+    risk_level, recommendation, is_phishing = EMAIL_RISK_LUT[threat_score]
+    
+    result = {
+        'phishing_probability': round(phishing_probability, 4),
+        'threat_score': threat_score,
+        'risk_level': risk_level,
+        'is_phishing': is_phishing,
+        'reasons': reasons,
+        'suspicious_links': suspicious_links,
+        'sender_spoofing': sender_spoofing,
+        'urgency_detected': urgency_detected,
+        'recommendation': recommendation,
+        'timestamp': datetime.now(timezone.utc)
+    }
+    
+    return result
+
+
+@router.post("/analyze/email", responses={200: {"model": EmailAnalysisResponse}})
 async def analyze_email(request: EmailAnalysisRequest):
     """
     Analyze email for phishing threats (BONUS FEATURE)
@@ -124,115 +309,11 @@ async def analyze_email(request: EmailAnalysisRequest):
     try:
         logger.info(f"Analyzing email from: {request.sender}")
         
-        reasons = []
-        suspicious_links = []
-        threat_score = 0
-        
-        # Check sender spoofing
-        sender_spoofing = False
-        if request.sender_name and request.sender:
-            sender_domain = request.sender.split('@')[-1].lower()
-            sender_name_lower = request.sender_name.lower()
-            
-            # Check if display name mentions a brand but email domain doesn't match
-            for brand in ['paypal', 'microsoft', 'google', 'apple', 'amazon', 'facebook']:
-                if brand in sender_name_lower and brand not in sender_domain:
-                    sender_spoofing = True
-                    threat_score += 30
-                    reasons.append({
-                        'factor': f"Sender spoofing: Display name mentions '{brand}' but domain is '{sender_domain}'",
-                        'severity': 'critical',
-                        'weight': 30,
-                        'source': 'sender_analysis'
-                    })
-                    break
-        
-        # Check for urgency keywords
-        urgency_keywords = [
-            'urgent', 'immediate', 'suspend', 'locked', 'verify', 'confirm',
-            'expire', 'within 24 hours', 'act now', 'limited time', 'unusual activity'
-        ]
-        urgency_detected = False
-        combined_text = f"{request.subject} {request.body}".lower()
-        
-        urgency_count = sum(1 for keyword in urgency_keywords if keyword in combined_text)
-        if urgency_count >= 2:
-            urgency_detected = True
-            threat_score += 20
-            reasons.append({
-                'factor': f"Urgency tactics detected ({urgency_count} urgency keywords)",
-                'severity': 'high',
-                'weight': 20,
-                'source': 'content_analysis'
-            })
-        
-        # Analyze links
-        if request.links:
-            for link in request.links:
-                try:
-                    # Quick heuristic check for links
-                    link_features = url_feature_extractor.extract_all_features(link)
-                    link_heuristic = heuristic_scorer.calculate_score(link_features)
-                    
-                    if link_heuristic['score'] >= 50:
-                        suspicious_links.append(link)
-                        threat_score += 15
-                        reasons.append({
-                            'factor': f"Suspicious link detected: {link[:50]}...",
-                            'severity': 'high',
-                            'weight': 15,
-                            'source': 'link_analysis'
-                        })
-                except Exception as e:
-                    logger.warning(f"Error analyzing link {link}: {e}")
-        
-        # Check attachments
-        if request.attachments:
-            suspicious_extensions = ['.exe', '.scr', '.bat', '.cmd', '.com', '.pif', '.vbs', '.js']
-            for attachment in request.attachments:
-                filename = attachment.get('filename', '').lower()
-                if any(filename.endswith(ext) for ext in suspicious_extensions):
-                    threat_score += 25
-                    reasons.append({
-                        'factor': f"Suspicious attachment: {filename}",
-                        'severity': 'critical',
-                        'weight': 25,
-                        'source': 'attachment_analysis'
-                    })
-        
-        # Normalize score
-        threat_score = min(threat_score, 100)
-        phishing_probability = threat_score / 100
-        
-        # Determine risk level
-        if threat_score >= 85:
-            risk_level = 'critical'
-        elif threat_score >= 60:
-            risk_level = 'dangerous'
-        elif threat_score >= 30:
-            risk_level = 'suspicious'
-        else:
-            risk_level = 'safe'
-        
-        is_phishing = threat_score >= 60
-        recommendation = 'block' if threat_score >= 60 else 'warn' if threat_score >= 30 else 'allow'
-        
-        result = {
-            'phishing_probability': round(phishing_probability, 4),
-            'threat_score': threat_score,
-            'risk_level': risk_level,
-            'is_phishing': is_phishing,
-            'reasons': reasons,
-            'suspicious_links': suspicious_links,
-            'sender_spoofing': sender_spoofing,
-            'urgency_detected': urgency_detected,
-            'recommendation': recommendation,
-            'timestamp': datetime.now().isoformat()
-        }
+        result = await asyncio.to_thread(_analyze_email_sync, request)
         
-        logger.info(f"Email analysis complete: {request.sender} - Score: {threat_score}")
+        logger.info(f"Email analysis complete: {request.sender} - Score: {result['threat_score']}")
         
-        return EmailAnalysisResponse(**result)
+        return ORJSONResponse(content=result)
     
     except Exception as e:
         logger.error(f"Error analyzing email from {request.sender}: {e}", exc_info=True)
@@ -246,7 +327,7 @@ async def analyze_email(request: EmailAnalysisRequest):
         )
 
 
-@router.get("/threat-intel/domain/{domain}", response_model=DomainReputationResponse)
+@router.get("/threat-intel/domain/{domain}", responses={200: {"model": DomainReputationResponse}})
 async def get_domain_reputation(domain: str):
     """
     Get domain reputation from threat intelligence sources
@@ -258,13 +339,14 @@ async def get_domain_reputation(domain: str):
         cache_key = f"domain_reputation:{domain}"
         cached = threat_cache.get_threat_intel('domain', domain)
         if cached:
-            return DomainReputationResponse(**cached)
+            return ORJSONResponse(content=cached)
         
         # Check threat intelligence
         url = f"https://{domain}"
-        threat_intel_result = threat_intelligence.check_all(url)
+        threat_intel_result = await threat_intelligence.check_all_async(url)
         
         is_malicious = threat_intel_result['threat_intel_score'] >= 60
+        now = datetime.now(timezone.utc)
         
         result = {
             'domain': domain,
@@ -276,14 +358,14 @@ async def get_domain_reputation(domain: str):
                 'openphish': threat_intel_result.get('openphish', {})
             },
             'first_seen': None,
-            'last_seen': datetime.now().isoformat(),
-            'timestamp': datetime.now().isoformat()
+            'last_seen': now,
+            'timestamp': now
         }
         
         # Cache result
         threat_cache.set_threat_intel('domain', domain, result, ttl=3600)
         
-        return DomainReputationResponse(**result)
+        return ORJSONResponse(content=result)
     
     except Exception as e:
         logger.error(f"Error looking up domain {domain}: {e}", exc_info=True)
@@ -7,6 +7,7 @@ try:
     from pydantic_settings import BaseSettings
 except ImportError:
     from pydantic import BaseSettings
+from dataclasses import make_dataclass
 from functools import lru_cache
 
 
@@ -23,23 +24,27 @@ class Settings(BaseSettings):
     VIRUSTOTAL_API_KEY: Optional[str] = None
     ABUSEIPDB_API_KEY: Optional[str] = None
     OPENPHISH_FEED_URL: str = "https://openphish.com/feed.txt"
+    KNOWN_GOOD_DOMAINS_FILE: Optional[str] = None  # e.g. Tranco top-1M CSV; skips SSL/WHOIS probes
     
     # Redis Configuration
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_PASSWORD: Optional[str] = None
+    CACHE_NAMESPACE: str = "phishguard"  # prefix of every key this app writes
     
     # Supabase Configuration
     SUPABASE_URL: Optional[str] = None
     SUPABASE_KEY: Optional[str] = None
     
     # Performance Settings
-    MAX_WORKERS: int = 4
+    MAX_WORKERS: int = 32             # analysis thread pool size
     REQUEST_TIMEOUT: int = 3
     CACHE_TTL_POSITIVE: int = 604800  # 7 days
     CACHE_TTL_NEGATIVE: int = 86400   # 24 hours
     CACHE_TTL_CRITICAL: int = -1      # Permanent (until manual review)
+    PROBE_CACHE_TTL: int = 3600       # SSL/WHOIS results per host, 1 hour
+    PROBE_CACHE_SIZE: int = 4096      # hosts kept per probe cache
     
     # Rate Limiting
     VIRUSTOTAL_RATE_LIMIT: int = 4    # requests per minute
@@ -49,6 +54,7 @@ class Settings(BaseSettings):
     ML_MODEL_PATH: str = "models/"
     MODEL_VERSION: str = "v1.0"
     ML_INFERENCE_TIMEOUT: float = 0.05  # 50ms
+    PRIMARY_MODEL_TYPE: str = "random_forest"  # or "lightgbm" (needs lightgbm installed)
     
     # Performance Targets
     TARGET_LATENCY_MS: int = 200
@@ -71,7 +77,20 @@ class Settings(BaseSettings):
         case_sensitive = True
 
 
+# Immutable, slotted snapshot of Settings handed out to the rest of the app.
+# Settings only does the one-time env parsing; hot-path reads then avoid
+# the pydantic attribute protocol.
+FrozenSettings = make_dataclass(
+    'FrozenSettings',
+    list(Settings.__annotations__.items()),
+    frozen=True,
+    slots=True
+)
+FrozenSettings.__module__ = __name__
+
+
 @lru_cache()
-def get_settings() -> Settings:
+def get_settings() -> FrozenSettings:
     """Get cached settings instance"""
-    return Settings()
+    parsed = Settings()
+    return FrozenSettings(**{name: getattr(parsed, name) for name in Settings.__annotations__})
@@ -5,10 +5,27 @@ Detects when pages impersonate trusted brands using visual/CSS analysis
 from typing import Dict, Any, Optional, List
 import re
 import logging
-import tldextract
+try:
+    from Levenshtein import distance
+except ImportError:
+    # Reuse the pure-Python fallback from the lookalike detector
+    from features.lookalike_detector import lev_distance as distance
+
+from utils import domain_parts
+from utils.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
+_REGEX_META = set('\\.^$*+?{}[]()|')
+
+
+def _literal_prefix(pattern: str) -> str:
+    """Return the leading literal text of a regex pattern"""
+    for i, char in enumerate(pattern):
+        if char in _REGEX_META:
+            return pattern[:i]
+    return pattern
+
 
 class BrandImpersonationDetector:
     """Detect brand impersonation through page content analysis"""
@@ -16,10 +33,19 @@ class BrandImpersonationDetector:
     def __init__(self):
         # Brand signatures (colors, patterns, common terms)
         self.brand_signatures = self._load_brand_signatures()
+        
+        # All brand keywords and pattern prefixes, matched in a single pass over the page text
+        self._trigger_matcher = KeywordMatcher(
+            set().union(*(signature['_triggers'] for signature in self.brand_signatures.values()))
+        )
+        # Every brand's title keywords, matched in a single pass over the page title
+        self._title_matcher = KeywordMatcher(
+            set().union(*(signature['_title_keywords'] for signature in self.brand_signatures.values()))
+        )
     
     def _load_brand_signatures(self) -> Dict[str, Dict[str, Any]]:
         """Load brand visual/textual signatures"""
-        return {
+        signatures = {
             # Tech Giants
             'google': {
                 'colors': ['#4285F4', '#EA4335', '#FBBC04', '#34A853'],
@@ -127,6 +153,21 @@ class BrandImpersonationDetector:
                 'patterns': [r'binance\s+log', r'binance\s+account']
             }
         }
+        
+        # Normalize once so the per-request loop doesn't have to
+        for brand, signature in signatures.items():
+            signature['keywords'] = [kw.lower() for kw in signature['keywords']]
+            signature['colors'] = frozenset(c.upper() for c in signature['colors'])
+            signature['patterns'] = [re.compile(p, re.IGNORECASE) for p in signature['patterns']]
+            signature['_key'] = brand.replace(' ', '')
+            signature['_title_keywords'] = frozenset(signature['keywords'][:3])
+            # A brand can't reach the impersonation threshold without one of
+            # these appearing in the text (patterns need their literal prefix)
+            signature['_triggers'] = frozenset(signature['keywords']) | {
+                _literal_prefix(p.pattern) for p in signature['patterns']
+            }
+        
+        return signatures
     
     def detect_impersonation(
         self, 
@@ -153,86 +194,47 @@ class BrandImpersonationDetector:
                 'indicators': List[str]
             }
         """
-        import tldextract
-        
         try:
-            extracted = tldextract.extract(url)
+            extracted = domain_parts.extract(url)
             domain = extracted.domain.lower()
             full_domain = f"{domain}.{extracted.suffix}".lower()
             
-            indicators = []
             suspected_brand = None
+            best = None
             max_score = 0
             
-            # Combine all text for analysis
+            # Combine all text for analysis (lowercased piecewise so the
+            # title's lowercase copy is reused instead of recomputed)
+            title_lower = page_title.lower() if page_title else None
             combined_text = ' '.join(filter(None, [
-                page_title or '',
-                page_text or '',
-                url
-            ])).lower()
+                title_lower,
+                page_text.lower() if page_text else None,
+                url.lower()
+            ]))
+            matched_triggers = self._trigger_matcher.find(combined_text)
+            css_set = frozenset(c.upper() for c in css_colors) if css_colors else frozenset()
+            title_keywords = self._title_matcher.find(title_lower) if title_lower and matched_triggers else None
             
-            # Check each brand
+            # Check each brand (counts only; indicators are built for the winner)
             for brand, signature in self.brand_signatures.items():
-                score = 0
-                brand_indicators = []
-                
                 # Check if domain contains brand name (legitimate)
-                if brand in domain or brand.replace(' ', '') in domain:
+                if brand in domain or signature['_key'] in domain:
                     # This is likely the legitimate site
                     continue
                 
-                # Check if brand name appears in title/content but NOT in domain
-                keyword_matches = 0
-                for keyword in signature['keywords']:
-                    if keyword.lower() in combined_text:
-                        keyword_matches += 1
-                        brand_indicators.append(f"Contains '{keyword}' keyword")
-                
-                if keyword_matches >= 2:
-                    score += 30
-                
-                # Check patterns
-                pattern_matches = 0
-                for pattern in signature['patterns']:
-                    if re.search(pattern, combined_text, re.IGNORECASE):
-                        pattern_matches += 1
-                        brand_indicators.append(f"Matches {brand} pattern")
-                
-                if pattern_matches >= 1:
-                    score += 25
-                
-                # Check color scheme (if CSS colors provided)
-                if css_colors:
-                    color_matches = 0
-                    for brand_color in signature['colors']:
-                        # Normalize colors
-                        normalized_colors = [c.upper() for c in css_colors]
-                        if brand_color.upper() in normalized_colors:
-                            color_matches += 1
-                    
-                    if color_matches >= 2:
-                        score += 20
-                        brand_indicators.append(f"Uses {brand}'s color scheme ({color_matches} colors matched)")
-                
-                # Check title specifically
-                if page_title:
-                    title_lower = page_title.lower()
-                    if any(kw in title_lower for kw in signature['keywords'][:3]):
-                        score += 15
-                        brand_indicators.append(f"Page title references {brand}")
+                # Skip brands with no keyword/pattern evidence in the text
+                if signature['_triggers'].isdisjoint(matched_triggers):
+                    continue
                 
-                # Domain dissimilarity penalty
-                from Levenshtein import distance
-                domain_distance = distance(domain, brand.replace(' ', ''))
-                if domain_distance > 3:
-                    score += 10
-                    brand_indicators.append(f"Domain doesn't match {brand} (distance: {domain_distance})")
+                hits = self._score_brand(signature, domain, combined_text, matched_triggers, css_set, title_keywords)
                 
                 # Update if this is the best match
-                if score > max_score and score >= 40:  # Threshold for impersonation
-                    max_score = score
+                if hits[0] > max_score and hits[0] >= 40:  # Threshold for impersonation
+                    max_score = hits[0]
                     suspected_brand = brand
-                    indicators = brand_indicators
+                    best = hits
+            
+            indicators = self._brand_indicators(suspected_brand, matched_triggers, best) if best else []
             
             # Normalize score to 0-100
             impersonation_score = min(max_score, 100)
@@ -253,13 +255,78 @@ class BrandImpersonationDetector:
                 'suspected_brand': suspected_brand,
                 'confidence': round(confidence, 2),
                 'indicators': indicators[:5],  # Top 5 indicators
-                'brand_in_title': bool(suspected_brand and page_title and suspected_brand in page_title.lower())
+                'brand_in_title': bool(suspected_brand and title_lower and suspected_brand in title_lower)
             }
             
         except Exception as e:
             logger.error(f"Error in brand impersonation detection: {e}")
             return self._get_default_result()
     
+    def _score_brand(
+        self,
+        signature: Dict[str, Any],
+        domain: str,
+        combined_text: str,
+        matched_triggers: set,
+        css_set: frozenset,
+        title_keywords: Optional[set]
+    ) -> tuple:
+        """
+        Score one brand's evidence
+        
+        Returns:
+            (score, keyword_matches, pattern_matches, color_matches, title_hit, domain_distance)
+        """
+        score = 0
+        
+        # Check if brand name appears in title/content but NOT in domain
+        keyword_matches = sum(1 for keyword in signature['keywords'] if keyword in matched_triggers)
+        if keyword_matches >= 2:
+            score += 30
+        
+        # Check patterns
+        pattern_matches = sum(1 for pattern in signature['patterns'] if pattern.search(combined_text))
+        if pattern_matches >= 1:
+            score += 25
+        
+        # Check color scheme (if CSS colors provided)
+        color_matches = len(css_set & signature['colors']) if css_set else 0
+        if color_matches >= 2:
+            score += 20
+        
+        # Check title specifically
+        title_hit = title_keywords is not None and not signature['_title_keywords'].isdisjoint(title_keywords)
+        if title_hit:
+            score += 15
+        
+        # Domain dissimilarity penalty (only worth computing if the
+        # +10 could still lift this brand over the threshold)
+        domain_distance = 0
+        if score >= 30:
+            domain_distance = distance(domain, signature['_key'])
+            if domain_distance > 3:
+                score += 10
+        
+        return score, keyword_matches, pattern_matches, color_matches, title_hit, domain_distance
+    
+    def _brand_indicators(self, brand: str, matched_triggers: set, hits: tuple) -> List[str]:
+        """Build the human-readable indicators for the winning brand"""
+        signature = self.brand_signatures[brand]
+        _, _, pattern_matches, color_matches, title_hit, domain_distance = hits
+        
+        indicators = [
+            f"Contains '{keyword}' keyword"
+            for keyword in signature['keywords'] if keyword in matched_triggers
+        ]
+        indicators.extend([f"Matches {brand} pattern"] * pattern_matches)
+        if color_matches >= 2:
+            indicators.append(f"Uses {brand}'s color scheme ({color_matches} colors matched)")
+        if title_hit:
+            indicators.append(f"Page title references {brand}")
+        if domain_distance > 3:
+            indicators.append(f"Domain doesn't match {brand} (distance: {domain_distance})")
+        return indicators
+    
     def _get_default_result(self) -> Dict[str, Any]:
         """Return default result on error"""
         return {
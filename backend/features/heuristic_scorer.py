@@ -2,196 +2,212 @@
 Heuristic Scoring Engine
 Rule-based threat detection using URL patterns and features
 """
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Callable, NamedTuple, Sequence, Union
+from functools import lru_cache, partial
+from numbers import Real
+import operator
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+# Rule comparison operators
+GT, GE, EQ, RANGE = range(4)
+
+_NAN = float('nan')
+
+# Features whose "missing" value is -1 rather than 0
+FEATURE_DEFAULTS = {
+    'ssl_certificate_age_days': -1,
+    'domain_age_days': -1,
+}
+
+# (name, feature key(s), operator, threshold, score, severity, explanation)
+# A tuple of keys is compared against a tuple threshold; RANGE is [low, high);
+# "{value}" in an explanation is filled with the feature value.
+RULES = (
+    # Length-based rules
+    ('Extremely long URL', 'url_length', GT, 75, 15, 'medium',
+     'URL length exceeds 75 characters (common in phishing)'),
+    ('Very long domain', 'domain_length', GT, 30, 10, 'low',
+     'Domain name is unusually long'),
+    
+    # Structural rules
+    ('Multiple subdomains', 'subdomain_count', GE, 3, 20, 'high',
+     'Contains 3+ subdomains (obfuscation technique)'),
+    ('Deep path structure', 'path_depth', GT, 5, 12, 'medium',
+     'Path depth exceeds 5 levels (suspicious structure)'),
+    ('Many query parameters', 'query_param_count', GT, 10, 8, 'low',
+     'Contains excessive query parameters'),
+    
+    # Character pattern rules
+    ('High digit ratio', 'digit_ratio', GT, 0.2, 15, 'medium',
+     'Unusually high number of digits in URL'),
+    ('High special character ratio', 'special_char_ratio', GT, 0.3, 12, 'medium',
+     'Excessive special characters detected'),
+    ('Multiple hyphens in domain', 'hyphen_count', GT, 3, 15, 'medium',
+     'Domain contains multiple hyphens (typosquatting indicator)'),
+    
+    # Entropy rules
+    ('High URL entropy', 'url_entropy', GT, 4.5, 18, 'high',
+     'High entropy suggests randomly generated or obfuscated URL'),
+    ('High domain entropy', 'domain_entropy', GT, 4.0, 15, 'medium',
+     'Domain has high entropy (possibly DGA-generated)'),
+    
+    # Suspicious pattern rules
+    ('IP address instead of domain', 'has_ip_address', EQ, 1, 30, 'critical',
+     'Uses IP address instead of domain name'),
+    ('Suspicious TLD', 'has_suspicious_tld', EQ, 1, 20, 'high',
+     'Uses commonly abused TLD (.tk, .ml, .xyz, etc.)'),
+    ('Multiple suspicious keywords', 'suspicious_keyword_count', GE, 2, 25, 'high',
+     'Contains {value} phishing-related keywords'),
+    ('At symbol in URL', 'at_symbol', EQ, 1, 20, 'high',
+     '@ symbol used for URL manipulation'),
+    ('Double slash redirecting', 'has_double_slash_redirecting', EQ, 1, 18, 'medium',
+     'Multiple // detected (redirect obfuscation)'),
+    ('Prefix/suffix in domain', 'prefix_suffix_in_domain', EQ, 1, 15, 'medium',
+     'Domain contains hyphens (brand imitation technique)'),
+    
+    # Port rules
+    ('Non-standard port', 'uses_non_standard_port', EQ, 1, 12, 'medium',
+     'Uses non-standard port number'),
+    
+    # Security rules
+    ('No HTTPS', 'is_https', EQ, 0, 10, 'low',
+     'Not using secure HTTPS protocol'),
+    ('Invalid or missing SSL', ('has_valid_ssl', 'is_https'), EQ, (0, 1), 25, 'high',
+     'HTTPS but invalid/missing SSL certificate'),
+    ('Very new SSL certificate', 'ssl_certificate_age_days', RANGE, (0, 30), 15, 'medium',
+     'SSL certificate issued less than 30 days ago'),
+    
+    # Domain age rules
+    ('Recently registered domain', 'domain_registered_recently', EQ, 1, 20, 'high',
+     'Domain registered less than 6 months ago'),
+    ('Very new domain', 'domain_age_days', RANGE, (0, 30), 30, 'critical',
+     'Domain registered less than 30 days ago'),
+)
+
+
+# Fixed feature layout: calculate_score() also accepts a sequence or NumPy
+# array of values in this order (missing features use FEATURE_DEFAULTS)
+FEATURE_KEYS = tuple(dict.fromkeys(
+    key for rule in RULES
+    for key in (rule[1] if isinstance(rule[1], tuple) else (rule[1],))
+))
+FEATURE_INDEX = {key: index for index, key in enumerate(FEATURE_KEYS)}
+
+
+def _compile_test(op: int, threshold: Any) -> Callable[[Any], bool]:
+    """Build the predicate for one rule (C-level where possible)"""
+    if op == GT:
+        return partial(operator.lt, threshold)  # threshold < value
+    if op == GE:
+        return partial(operator.le, threshold)  # threshold <= value
+    if op == EQ:
+        return partial(operator.eq, threshold)
+    low, high = threshold
+    return lambda value: low <= value < high
+
+
+def _condition_source(op: int, threshold: Any, index: Union[int, Tuple[int, ...]]) -> str:
+    """Python expression for one rule over the value sequence ``v`` (same operand order as _compile_test)"""
+    if isinstance(index, tuple):
+        value = '(' + ', '.join(f'v[{i}]' for i in index) + ',)'
+    else:
+        value = f'v[{index}]'
+    if op == GT:
+        return f'{threshold!r} < {value}'
+    if op == GE:
+        return f'{threshold!r} <= {value}'
+    if op == EQ:
+        return f'{threshold!r} == {value}'
+    low, high = threshold
+    return f'{low!r} <= {value} < {high!r}'
+
+
+class Rule(NamedTuple):
+    """A compiled heuristic rule (field order matches the calculate_score unpacking)"""
+    name: str
+    index: Union[int, Tuple[int, ...]]  # into FEATURE_KEYS; a tuple for compound rules
+    test: Callable[[Any], bool]
+    score: int
+    severity: str
+    explanation: str
+    templated: bool  # explanation contains "{value}"
+    condition: str  # source of the same test, for the generated matcher
+
+
 class HeuristicScorer:
     """Calculate heuristic threat score based on URL features"""
     
     def __init__(self):
         self.rules = self._initialize_rules()
+        # Plain-tuple copies for the hot loop (unpacking a tuple subclass is slower)
+        self._rule_rows = tuple(tuple(rule) for rule in self.rules)
+        self._feature_defaults = tuple((key, FEATURE_DEFAULTS.get(key, 0)) for key in FEATURE_KEYS)
+        self._feature_getter = operator.itemgetter(*FEATURE_KEYS)
+        self._match_mask = self._build_matcher()
+        self._value_kinds = self._build_value_kinds()
+        self._score_cached = lru_cache(maxsize=4096)(self._score_values)
     
-    def _initialize_rules(self) -> List[Dict[str, Any]]:
-        """Initialize scoring rules with weights"""
-        return [
-            # Length-based rules
-            {
-                'name': 'Extremely long URL',
-                'condition': lambda f: f.get('url_length', 0) > 75,
-                'score': 15,
-                'severity': 'medium',
-                'explanation': 'URL length exceeds 75 characters (common in phishing)'
-            },
-            {
-                'name': 'Very long domain',
-                'condition': lambda f: f.get('domain_length', 0) > 30,
-                'score': 10,
-                'severity': 'low',
-                'explanation': 'Domain name is unusually long'
-            },
-            
-            # Structural rules
-            {
-                'name': 'Multiple subdomains',
-                'condition': lambda f: f.get('subdomain_count', 0) >= 3,
-                'score': 20,
-                'severity': 'high',
-                'explanation': 'Contains 3+ subdomains (obfuscation technique)'
-            },
-            {
-                'name': 'Deep path structure',
-                'condition': lambda f: f.get('path_depth', 0) > 5,
-                'score': 12,
-                'severity': 'medium',
-                'explanation': 'Path depth exceeds 5 levels (suspicious structure)'
-            },
-            {
-                'name': 'Many query parameters',
-                'condition': lambda f: f.get('query_param_count', 0) > 10,
-                'score': 8,
-                'severity': 'low',
-                'explanation': 'Contains excessive query parameters'
-            },
-            
-            # Character pattern rules
-            {
-                'name': 'High digit ratio',
-                'condition': lambda f: f.get('digit_ratio', 0) > 0.2,
-                'score': 15,
-                'severity': 'medium',
-                'explanation': 'Unusually high number of digits in URL'
-            },
-            {
-                'name': 'High special character ratio',
-                'condition': lambda f: f.get('special_char_ratio', 0) > 0.3,
-                'score': 12,
-                'severity': 'medium',
-                'explanation': 'Excessive special characters detected'
-            },
-            {
-                'name': 'Multiple hyphens in domain',
-                'condition': lambda f: f.get('hyphen_count', 0) > 3,
-                'score': 15,
-                'severity': 'medium',
-                'explanation': 'Domain contains multiple hyphens (typosquatting indicator)'
-            },
-            
-            # Entropy rules
-            {
-                'name': 'High URL entropy',
-                'condition': lambda f: f.get('url_entropy', 0) > 4.5,
-                'score': 18,
-                'severity': 'high',
-                'explanation': 'High entropy suggests randomly generated or obfuscated URL'
-            },
-            {
-                'name': 'High domain entropy',
-                'condition': lambda f: f.get('domain_entropy', 0) > 4.0,
-                'score': 15,
-                'severity': 'medium',
-                'explanation': 'Domain has high entropy (possibly DGA-generated)'
-            },
-            
-            # Suspicious pattern rules
-            {
-                'name': 'IP address instead of domain',
-                'condition': lambda f: f.get('has_ip_address', 0) == 1,
-                'score': 30,
-                'severity': 'critical',
-                'explanation': 'Uses IP address instead of domain name'
-            },
-            {
-                'name': 'Suspicious TLD',
-                'condition': lambda f: f.get('has_suspicious_tld', 0) == 1,
-                'score': 20,
-                'severity': 'high',
-                'explanation': 'Uses commonly abused TLD (.tk, .ml, .xyz, etc.)'
-            },
-            {
-                'name': 'Multiple suspicious keywords',
-                'condition': lambda f: f.get('suspicious_keyword_count', 0) >= 2,
-                'score': 25,
-                'severity': 'high',
-                'explanation': lambda f: f"Contains {f.get('suspicious_keyword_count', 0)} phishing-related keywords"
-            },
-            {
-                'name': 'At symbol in URL',
-                'condition': lambda f: f.get('at_symbol', 0) == 1,
-                'score': 20,
-                'severity': 'high',
-                'explanation': '@ symbol used for URL manipulation'
-            },
-            {
-                'name': 'Double slash redirecting',
-                'condition': lambda f: f.get('has_double_slash_redirecting', 0) == 1,
-                'score': 18,
-                'severity': 'medium',
-                'explanation': 'Multiple // detected (redirect obfuscation)'
-            },
-            {
-                'name': 'Prefix/suffix in domain',
-                'condition': lambda f: f.get('prefix_suffix_in_domain', 0) == 1,
-                'score': 15,
-                'severity': 'medium',
-                'explanation': 'Domain contains hyphens (brand imitation technique)'
-            },
-            
-            # Port rules
-            {
-                'name': 'Non-standard port',
-                'condition': lambda f: f.get('uses_non_standard_port', 0) == 1,
-                'score': 12,
-                'severity': 'medium',
-                'explanation': 'Uses non-standard port number'
-            },
-            
-            # Security rules
-            {
-                'name': 'No HTTPS',
-                'condition': lambda f: f.get('is_https', 0) == 0,
-                'score': 10,
-                'severity': 'low',
-                'explanation': 'Not using secure HTTPS protocol'
-            },
-            {
-                'name': 'Invalid or missing SSL',
-                'condition': lambda f: f.get('has_valid_ssl', 0) == 0 and f.get('is_https', 0) == 1,
-                'score': 25,
-                'severity': 'high',
-                'explanation': 'HTTPS but invalid/missing SSL certificate'
-            },
-            {
-                'name': 'Very new SSL certificate',
-                'condition': lambda f: 0 <= f.get('ssl_certificate_age_days', -1) < 30,
-                'score': 15,
-                'severity': 'medium',
-                'explanation': 'SSL certificate issued less than 30 days ago'
-            },
-            
-            # Domain age rules
-            {
-                'name': 'Recently registered domain',
-                'condition': lambda f: f.get('domain_registered_recently', 0) == 1,
-                'score': 20,
-                'severity': 'high',
-                'explanation': 'Domain registered less than 6 months ago'
-            },
-            {
-                'name': 'Very new domain',
-                'condition': lambda f: 0 <= f.get('domain_age_days', -1) < 30,
-                'score': 30,
-                'severity': 'critical',
-                'explanation': 'Domain registered less than 30 days ago'
-            }
-        ]
+    def _initialize_rules(self) -> Tuple[Rule, ...]:
+        """
+        Compile RULES into Rule tuples, ordered by descending score (stable,
+        so ties keep their RULES order)
+        """
+        rules = []
+        for name, key, op, threshold, score, severity, explanation in sorted(RULES, key=lambda r: -r[4]):
+            index = tuple(FEATURE_INDEX[k] for k in key) if isinstance(key, tuple) else FEATURE_INDEX[key]
+            rules.append(Rule(
+                name=name,
+                index=index,
+                test=_compile_test(op, threshold),
+                score=score,
+                severity=severity,
+                explanation=explanation,
+                templated='{value}' in explanation,
+                condition=_condition_source(op, threshold, index)
+            ))
+        return tuple(rules)
+    
+    def _build_value_kinds(self) -> Callable[[Sequence], Any]:
+        """
+        Return a function giving the types of the features quoted in
+        explanations, so 2 and 2.0 (equal as cache keys) keep their own text
+        """
+        indexes = sorted({rule.index for rule in self.rules if rule.templated})
+        if not indexes:
+            return lambda values: None
+        getter = operator.itemgetter(*indexes)
+        if len(indexes) == 1:
+            return lambda values: type(getter(values))
+        return lambda values: tuple(map(type, getter(values)))
     
-    def calculate_score(self, features: Dict[str, Any]) -> Dict[str, Any]:
+    def _build_matcher(self) -> Callable[[Sequence], int]:
+        """
+        Generate a straight-line function returning a bitmask of matched rules
+        (bit i set = self.rules[i] matched), with thresholds inlined
+        """
+        lines = ['def _match_mask(v):', '    mask = 0']
+        for bit, rule in enumerate(self.rules):
+            lines.append(f'    if {rule.condition}:  # {rule.name}')
+            lines.append(f'        mask |= {1 << bit}')
+        lines.append('    return mask')
+        
+        namespace = {}
+        exec(compile('\n'.join(lines), '<heuristic_rules>', 'exec'), namespace)
+        return namespace['_match_mask']
+    
+    def calculate_score(self, features: Union[Dict[str, Any], Sequence]) -> Dict[str, Any]:
         """
         Calculate heuristic score and return detailed analysis
         
+        features is a feature dict, or a sequence / NumPy array laid out as
+        FEATURE_KEYS.
+        
+        Evaluation stops once the score saturates at 100 with at least three
+        matched rules, so matched_rules holds the top contributors only.
+        
         Returns:
             {
                 'score': int (0-100),
@@ -199,41 +215,85 @@ class HeuristicScorer:
                 'total_possible': int
             }
         """
-        matched_rules = []
-        total_score = 0
         max_possible_score = 100  # Normalize to 100
         
-        # Evaluate each rule
-        for rule in self.rules:
+        # Read every feature once, in FEATURE_KEYS order
+        if isinstance(features, dict):
             try:
-                if rule['condition'](features):
-                    explanation = rule['explanation']
-                    # Handle lambda explanations
-                    if callable(explanation):
-                        explanation = explanation(features)
-                    
-                    matched_rules.append({
-                        'name': rule['name'],
-                        'score': rule['score'],
-                        'severity': rule['severity'],
-                        'explanation': explanation
-                    })
-                    total_score += rule['score']
-            except Exception as e:
-                logger.error(f"Error evaluating rule {rule['name']}: {e}")
+                # One C-level call when every feature is present (the extractor's output)
+                values = self._feature_getter(features)
+            except KeyError:
+                get = features.get
+                values = [get(key, default) for key, default in self._feature_defaults]
+        elif hasattr(features, 'tolist'):
+            values = features.tolist()
+        else:
+            values = list(features)
+        
+        # Identical feature vectors (same domain, different paths) score identically
+        values = tuple(values)
+        key = (values, self._value_kinds(values))
+        try:
+            matched_rules, total_score = self._score_cached(key)
+        except TypeError:
+            # Unhashable feature value; score without the cache
+            matched_rules, total_score = self._score_values(key)
         
         # Normalize score to 0-100 range
         normalized_score = min(total_score, max_possible_score)
         
-        # Sort matched rules by score (descending)
-        matched_rules.sort(key=lambda x: x['score'], reverse=True)
+        # Rules are evaluated in descending score order, so matched_rules is already sorted
         
         return {
             'score': normalized_score,
-            'matched_rules': matched_rules,
+            'matched_rules': list(matched_rules),
             'rule_count': len(matched_rules)
         }
     
+    def _score_values(self, key: Tuple[tuple, tuple]) -> Tuple[Tuple[Dict, ...], int]:
+        """Evaluate the rules for one feature vector (memoized per instance)"""
+        values = key[0]
+        try:
+            matched_rules, total_score = self._evaluate_rules(values, 100)
+        except Exception as e:
+            # A non-numeric feature broke a comparison; treat such features as
+            # NaN (never matches) and evaluate again
+            logger.error(f"Error evaluating heuristic rules, ignoring non-numeric features: {e}")
+            values = [value if isinstance(value, Real) else _NAN for value in values]
+            matched_rules, total_score = self._evaluate_rules(values, 100)
+        return tuple(matched_rules), total_score
+    
+    def cache_clear(self):
+        """Drop memoized scores"""
+        self._score_cached.cache_clear()
+    
+    def _evaluate_rules(self, values: Sequence, max_possible_score: int) -> Tuple[List[Dict], int]:
+        """Evaluate the compiled rules over a FEATURE_KEYS-ordered value list"""
+        matched_rules = []
+        total_score = 0
+        
+        # Decode matched rules lowest bit (highest score) first
+        mask = self._match_mask(values)
+        rows = self._rule_rows
+        while mask:
+            low_bit = mask & -mask
+            mask ^= low_bit
+            name, index, _, score, severity, explanation, templated, _ = rows[low_bit.bit_length() - 1]
+            
+            matched_rules.append({
+                'name': name,
+                'score': score,
+                'severity': severity,
+                'explanation': explanation.format(value=values[index]) if templated else explanation
+            })
+            total_score += score
+            
+            # Saturated: remaining rules can't change the score or the top reasons
+            if total_score >= max_possible_score and len(matched_rules) >= 3:
+                break
+        
+        return matched_rules, total_score
+    
     def get_top_reasons(self, matched_rules: List[Dict], top_n: int = 5) -> List[Dict]:
         """Get top N contributing reasons"""
         return matched_rules[:top_n]
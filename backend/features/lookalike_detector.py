@@ -2,6 +2,14 @@
 Lookalike Domain Detection Engine
 Detects typosquatting, homoglyphs, and brand impersonation
 """
+try:
+    # Batch scoring of a domain against every brand in native code
+    from rapidfuzz import process as rf_process
+    from rapidfuzz.distance import Indel
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
 try:
     from Levenshtein import distance as lev_distance, ratio as lev_ratio
 except ImportError:
@@ -10,22 +18,37 @@ except ImportError:
         lev_distance = Lev.distance
         lev_ratio = Lev.ratio
     except ImportError:
-        # Fallback implementation
+        # Fallback implementation: Myers/Hyyro bit-parallel Levenshtein, one
+        # pass over s1 with the columns of s2 packed into a Python int
         def lev_distance(s1, s2):
             if len(s1) < len(s2):
                 return lev_distance(s2, s1)
             if len(s2) == 0:
                 return len(s1)
-            previous_row = range(len(s2) + 1)
-            for i, c1 in enumerate(s1):
-                current_row = [i + 1]
-                for j, c2 in enumerate(s2):
-                    insertions = previous_row[j + 1] + 1
-                    deletions = current_row[j] + 1
-                    substitutions = previous_row[j] + (c1 != c2)
-                    current_row.append(min(insertions, deletions, substitutions))
-                previous_row = current_row
-            return previous_row[-1]
+            
+            # Bitmask of the positions of each character in s2
+            peq = {}
+            for i, c in enumerate(s2):
+                peq[c] = peq.get(c, 0) | (1 << i)
+            
+            mask = (1 << len(s2)) - 1
+            last = 1 << (len(s2) - 1)
+            pv, mv, score = mask, 0, len(s2)
+            for c in s1:
+                eq = peq.get(c, 0)
+                xv = eq | mv
+                xh = (((eq & pv) + pv) ^ pv) | eq
+                ph = mv | ~(xh | pv)
+                mh = pv & xh
+                if ph & last:
+                    score += 1
+                elif mh & last:
+                    score -= 1
+                ph = (ph << 1) | 1
+                mh <<= 1
+                pv = (mh | ~(xv | ph)) & mask
+                mv = ph & xv & mask
+            return score
         
         def lev_ratio(s1, s2):
             distance = lev_distance(s1, s2)
@@ -33,11 +56,32 @@ except ImportError:
             return (max_len - distance) / max_len if max_len > 0 else 1.0
 
 from typing import Dict, List, Optional, Tuple, Any
-import tldextract
+from collections import defaultdict
+from functools import lru_cache
+from os.path import commonprefix
+from urllib.parse import urlparse
+import numpy as np
 import logging
 
+from utils import domain_parts
+from utils.keyword_matcher import KeywordMatcher
+
 logger = logging.getLogger(__name__)
 
+# Domains scored per cdist call in detect_lookalike_batch (bounds the matrix size)
+BATCH_CHUNK_SIZE = 1024
+
+# Categories whose domains host arbitrary user content; never allowlisted outright
+USER_CONTENT_CATEGORIES = ('storage',)
+
+# Script markers for mixed-script detection (non-letters, so isalpha() skips them)
+_CYRILLIC_MARK = '\x01'
+_GREEK_MARK = '\x02'
+_SCRIPT_TABLE = {
+    **{code: _CYRILLIC_MARK for low, high in (('а', 'я'), ('А', 'Я')) for code in range(ord(low), ord(high) + 1)},
+    **{code: _GREEK_MARK for low, high in (('α', 'ω'), ('Α', 'Ω')) for code in range(ord(low), ord(high) + 1)},
+}
+
 
 class LookalikeDomainDetector:
     """Detect lookalike/typosquatting domains"""
@@ -65,7 +109,55 @@ class LookalikeDomainDetector:
             'l': ['1', 'I', 'і', '|'],  # One, capital I, Cyrillic i, pipe
         }
         
+        # (lookalike, legitimate) character pairs, in both directions
+        self._homoglyph_pairs = frozenset(
+            pair for char, lookalikes in self.homoglyphs.items()
+            for lookalike in lookalikes
+            for pair in ((lookalike, char), (char, lookalike))
+        )
+        
         self.similarity_threshold = 0.85  # 85% similarity = suspicious
+        
+        # Per-domain result cache (repeat hosts skip the brand scan)
+        self._detect_cached = lru_cache(maxsize=8192)(self._detect_for_domain)
+        
+        # Exact hosts that can skip full analysis (see is_trusted_host)
+        user_content_hosts = {
+            brand for category in USER_CONTENT_CATEGORIES
+            for brand in self.brand_whitelist.get(category, [])
+        }
+        self._trusted_hosts = frozenset(
+            brand.lower() for brands in self.brand_whitelist.values()
+            for brand in brands if brand not in user_content_hosts
+        )
+        
+        # Every category each whitelisted brand appears in
+        self._brand_categories = {}
+        for category, brands in self.brand_whitelist.items():
+            for brand in brands:
+                self._brand_categories.setdefault(brand, []).append(category)
+        
+        # One entry per distinct brand label, in scan order. Repeats (amazon.com
+        # in tech and ecommerce, usps.com vs usps.gov) score identically and the
+        # first occurrence wins ties, so dropping them never changes the result
+        first_by_label = {}
+        for category, brands in self.brand_whitelist.items():
+            for brand in brands:
+                first_by_label.setdefault(brand.split('.')[0].lower(), (brand, category))
+        self._brand_entries = [
+            (brand_domain, brand, category)
+            for brand_domain, (brand, category) in first_by_label.items()
+        ]
+        
+        # Bucketed by label length so the fallback scan can stop once no
+        # remaining length can beat the best similarity
+        brands_by_len = defaultdict(list)
+        for index, (brand_domain, _, _) in enumerate(self._brand_entries):
+            brands_by_len[len(brand_domain)].append((index, brand_domain))
+        self._brands_by_len = dict(brands_by_len)
+        self._embedded_brand_matcher = KeywordMatcher(entry[0] for entry in self._brand_entries)
+        self._brand_choices = [entry[0] for entry in self._brand_entries]
+        self._brand_index = {brand_domain: index for index, brand_domain in enumerate(self._brand_choices)}
     
     def _load_brand_whitelist(self) -> Dict[str, List[str]]:
         """Load whitelist of 500+ popular brand domains"""
@@ -238,113 +330,279 @@ class LookalikeDomainDetector:
             }
         """
         try:
-            extracted = tldextract.extract(url)
-            domain = extracted.domain.lower()
-            full_domain = f"{domain}.{extracted.suffix}".lower()
-            
-            best_match = None
-            best_similarity = 0.0
-            best_distance = 999
-            best_category = None
-            
-            # Check against all brands
-            for category, brands in self.brand_whitelist.items():
-                for brand in brands:
-                    brand_domain = brand.split('.')[0].lower()
-                    
-                    # Check if brand name is embedded in the domain (e.g., paypal in paypal-secure-verify)
-                    if brand_domain in domain and brand_domain != domain:
-                        # Brand name embedded in a longer domain - likely phishing
-                        similarity = 0.95  # High similarity for embedded brands
-                        distance = len(domain) - len(brand_domain)
-                    else:
-                        # Calculate Levenshtein distance
-                        distance = lev_distance(domain, brand_domain)
-                        
-                        # Calculate similarity ratio
-                        similarity = lev_ratio(domain, brand_domain)
-                    
-                    # Update best match
-                    if similarity > best_similarity:
-                        best_similarity = similarity
-                        best_distance = distance
-                        best_match = brand
-                        best_category = category
-            
-            # Check for homoglyphs
-            homoglyph_detected, homoglyph_details = self._check_homoglyphs(domain, best_match)
-            
-            # Determine if it's a lookalike
-            is_lookalike = (
-                best_similarity >= self.similarity_threshold and
-                best_match and
-                domain != best_match.split('.')[0].lower()
-            ) or homoglyph_detected
-            
-            # Calculate lookalike score (0-100)
-            lookalike_score = 0
-            if is_lookalike:
-                # Base score on similarity
-                lookalike_score = int(best_similarity * 100)
-                
-                # Bonus for homoglyphs (more sophisticated attack)
-                if homoglyph_detected:
-                    lookalike_score = min(100, lookalike_score + 15)
-                
-                # Bonus for very high similarity
-                if best_similarity > 0.95:
-                    lookalike_score = min(100, lookalike_score + 10)
-            
-            return {
-                'is_lookalike': is_lookalike,
-                'lookalike_score': lookalike_score,
-                'matched_brand': best_match if is_lookalike else None,
-                'brand_category': best_category if is_lookalike else None,
-                'similarity_score': round(best_similarity, 4),
-                'levenshtein_distance': best_distance,
-                'homoglyph_detected': homoglyph_detected,
-                'homoglyph_details': homoglyph_details
-            }
-            
+            domain = domain_parts.extract(url).domain
         except Exception as e:
             logger.error(f"Error in lookalike detection: {e}")
             return self._get_default_result()
-    
-    def _check_homoglyphs(self, domain: str, brand: Optional[str]) -> Tuple[bool, Optional[str]]:
-        """Check for homoglyph character substitutions"""
-        if not brand:
-            return False, None
         
-        brand_domain = brand.split('.')[0].lower()
-        
-        # Check each character
-        for i, (char_d, char_b) in enumerate(zip(domain, brand_domain)):
-            if char_d != char_b:
-                # Check if it's a known homoglyph
-                if char_b in self.homoglyphs:
-                    if char_d in self.homoglyphs[char_b]:
-                        return True, f"Uses '{char_d}' instead of '{char_b}' at position {i+1}"
-                
-                # Check reverse (char_d is the legitimate one)
-                if char_d in self.homoglyphs:
-                    if char_b in self.homoglyphs[char_d]:
-                        return True, f"Uses '{char_d}' instead of '{char_b}' at position {i+1}"
-        
-        # Check for mixed-script attacks (different unicode ranges)
+        return self.detect_lookalike_domain(domain)
+    
+    def detect_lookalike_domain(self, domain: str) -> Dict[str, Any]:
+        """
+        Detect lookalikes for an already-extracted registered domain label
+        (e.g. 'paypa1' for https://www.paypa1.com/), skipping tldextract
+        """
         try:
-            domain_scripts = set()
-            for char in domain:
-                if 'а' <= char <= 'я' or 'А' <= char <= 'Я':
-                    domain_scripts.add('cyrillic')
-                elif 'α' <= char <= 'ω' or 'Α' <= char <= 'Ω':
-                    domain_scripts.add('greek')
-                elif char.isalpha():
-                    domain_scripts.add('latin')
+            # Copy so callers can't mutate the cached result
+            return dict(self._detect_cached(domain.lower()))
             
-            if len(domain_scripts) > 1:
-                return True, f"Mixed scripts detected: {', '.join(domain_scripts)}"
         except Exception as e:
-            logger.debug(f"Error checking scripts: {e}")
+            logger.error(f"Error in lookalike detection: {e}")
+            return self._get_default_result()
+    
+    def detect_lookalike_batch(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """
+        Detect lookalikes for many URLs, scoring each distinct domain against
+        every brand in parallel rapidfuzz cdist calls
+        """
+        if not RAPIDFUZZ_AVAILABLE:
+            return [self.detect_lookalike(url) for url in urls]
+        
+        domains = []
+        for url in urls:
+            try:
+                domains.append(domain_parts.extract(url).domain.lower())
+            except Exception as e:
+                logger.error(f"Error in lookalike detection: {e}")
+                domains.append(None)
+        
+        results = {}
+        unique_domains = list(dict.fromkeys(domain for domain in domains if domain is not None))
+        for start in range(0, len(unique_domains), BATCH_CHUNK_SIZE):
+            chunk = unique_domains[start:start + BATCH_CHUNK_SIZE]
+            try:
+                # (domains x brands) similarity matrix; float64 so scores match extractOne
+                matrix = rf_process.cdist(
+                    chunk, self._brand_choices,
+                    scorer=Indel.normalized_similarity,
+                    processor=None,
+                    dtype=np.float64,
+                    workers=-1
+                )
+                for domain, row in zip(chunk, matrix):
+                    results[domain] = self._build_result(domain, self._best_brand_from_row(domain, row))
+            except Exception as e:
+                logger.error(f"Error in batch lookalike detection: {e}")
+        
+        return [
+            dict(results[domain]) if domain in results else self._get_default_result()
+            for domain in domains
+        ]
+    
+    def _detect_for_domain(self, domain: str) -> Dict[str, Any]:
+        """Run lookalike detection for a registered domain name (memoized per instance)"""
+        return self._build_result(domain, self._find_best_brand(domain))
+    
+    def _build_result(
+        self,
+        domain: str,
+        best: Tuple[Optional[str], Optional[str], float, int, Optional[str]]
+    ) -> Dict[str, Any]:
+        """Turn the best brand match for a domain into a lookalike result"""
+        best_label, best_match, best_similarity, best_distance, best_category = best
+        
+        # Check for homoglyphs (an exact brand match has no substitutions, and
+        # brand labels are ASCII so it can't mix scripts either)
+        if best_similarity == 1.0:
+            homoglyph_detected, homoglyph_details = False, None
+        else:
+            homoglyph_detected, homoglyph_details = self._check_homoglyphs(domain, best_label)
+        
+        # Determine if it's a lookalike
+        is_lookalike = (
+            best_similarity >= self.similarity_threshold and
+            best_match and
+            domain != best_label
+        ) or homoglyph_detected
+        
+        # Calculate lookalike score (0-100)
+        lookalike_score = 0
+        if is_lookalike:
+            # Base score on similarity
+            lookalike_score = int(best_similarity * 100)
+            
+            # Bonus for homoglyphs (more sophisticated attack)
+            if homoglyph_detected:
+                lookalike_score = min(100, lookalike_score + 15)
+            
+            # Bonus for very high similarity
+            if best_similarity > 0.95:
+                lookalike_score = min(100, lookalike_score + 10)
+        
+        return {
+            'is_lookalike': is_lookalike,
+            'lookalike_score': lookalike_score,
+            'matched_brand': best_match if is_lookalike else None,
+            'brand_category': best_category if is_lookalike else None,
+            'similarity_score': round(best_similarity, 4),
+            'levenshtein_distance': best_distance,
+            'homoglyph_detected': homoglyph_detected,
+            'homoglyph_details': homoglyph_details
+        }
+    
+    def _find_best_brand(self, domain: str) -> Tuple[Optional[str], Optional[str], float, int, Optional[str]]:
+        """
+        Find the most similar whitelisted brand (first in scan order on ties)
+        
+        Returns:
+            (brand label, brand, similarity, distance, category)
+        """
+        # Brand names embedded in a longer domain (e.g., paypal in
+        # paypal-secure-verify) score a flat, high similarity
+        embedded = self._embedded_brand_matcher.find(domain)
+        embedded.discard(domain)
+        
+        best_index = None
+        best_similarity = 0.0
+        if embedded:
+            best_index = next(
+                index for index, entry in enumerate(self._brand_entries)
+                if entry[0] in embedded
+            )
+            best_similarity = 0.95
+        
+        if RAPIDFUZZ_AVAILABLE:
+            best_index, best_similarity = self._extract_best_brand(domain, embedded, best_index, best_similarity)
+        else:
+            best_index, best_similarity = self._scan_brand_buckets(domain, embedded, best_index, best_similarity)
+        
+        return self._brand_match(domain, embedded, best_index, best_similarity)
+    
+    def _best_brand_from_row(
+        self,
+        domain: str,
+        row: np.ndarray
+    ) -> Tuple[Optional[str], Optional[str], float, int, Optional[str]]:
+        """_find_best_brand over a precomputed row of brand similarities"""
+        embedded = self._embedded_brand_matcher.find(domain)
+        embedded.discard(domain)
+        
+        if embedded:
+            # Embedded brands drop out of the fuzzy scan; the first of them
+            # stands in at the flat embedded similarity
+            indexes = [self._brand_index[brand_domain] for brand_domain in embedded]
+            row = row.copy()
+            row[indexes] = -1.0
+            row[min(indexes)] = 0.95
+        
+        # argmax returns the first maximum, i.e. the lowest index on ties
+        best_index = int(row.argmax())
+        best_similarity = float(row[best_index])
+        if best_similarity <= 0.0:
+            best_index, best_similarity = None, 0.0
+        
+        return self._brand_match(domain, embedded, best_index, best_similarity)
+    
+    def _brand_match(
+        self,
+        domain: str,
+        embedded: set,
+        best_index: Optional[int],
+        best_similarity: float
+    ) -> Tuple[Optional[str], Optional[str], float, int, Optional[str]]:
+        """Expand the winning brand index into (label, brand, similarity, distance, category)"""
+        if best_index is None:
+            return None, None, 0.0, 999, None
+        
+        brand_domain, brand, category = self._brand_entries[best_index]
+        if brand_domain in embedded:
+            distance = len(domain) - len(brand_domain)
+        else:
+            distance = lev_distance(domain, brand_domain)
+        return brand_domain, brand, best_similarity, distance, category
+    
+    def _extract_best_brand(
+        self,
+        domain: str,
+        embedded: set,
+        best_index: Optional[int],
+        best_similarity: float
+    ) -> Tuple[Optional[int], float]:
+        """Score the domain against all non-embedded brands in one rapidfuzz call"""
+        choices = self._brand_choices
+        if embedded:
+            choices = [None if brand_domain in embedded else brand_domain for brand_domain in choices]
+        
+        # Indel normalized similarity is what Levenshtein.ratio computes;
+        # extractOne keeps the first of equally good matches
+        match = rf_process.extractOne(
+            domain, choices,
+            scorer=Indel.normalized_similarity,
+            processor=None,
+            score_cutoff=best_similarity
+        )
+        if match is None:
+            return best_index, best_similarity
+        
+        _, similarity, index = match
+        if similarity > best_similarity or (
+            similarity == best_similarity and best_index is not None and index < best_index
+        ):
+            return index, similarity
+        return best_index, best_similarity
+    
+    def _scan_brand_buckets(
+        self,
+        domain: str,
+        embedded: set,
+        best_index: Optional[int],
+        best_similarity: float
+    ) -> Tuple[Optional[int], float]:
+        """Pure-Python brand scan, pruned by length-based similarity bounds"""
+        # Visit lengths from the highest similarity bound down; the ratio of two
+        # strings can't exceed 2 * min(len) / (len1 + len2)
+        domain_len = len(domain)
+        bounds = sorted(
+            (
+                (2 * min(domain_len, length) / (domain_len + length), length)
+                for length in self._brands_by_len
+            ),
+            reverse=True
+        )
+        for bound, length in bounds:
+            if bound + 1e-9 < best_similarity:
+                break
+            for index, brand_domain in self._brands_by_len[length]:
+                if brand_domain in embedded:
+                    continue
+                similarity = lev_ratio(domain, brand_domain)
+                if similarity > best_similarity or (
+                    similarity == best_similarity and best_index is not None and index < best_index
+                ):
+                    best_similarity = similarity
+                    best_index = index
+        
+        return best_index, best_similarity
+    
+    def _check_homoglyphs(self, domain: str, brand_domain: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Check for homoglyph character substitutions against a brand label"""
+        if brand_domain is None:
+            return False, None
+        
+        # Check each character against known homoglyph pairs (either direction),
+        # starting at the first mismatch (the shared prefix is compared in C)
+        start = len(commonprefix((domain, brand_domain)))
+        for i, (char_d, char_b) in enumerate(zip(domain[start:], brand_domain[start:]), start):
+            if char_d != char_b and (char_d, char_b) in self._homoglyph_pairs:
+                return True, f"Uses '{char_d}' instead of '{char_b}' at position {i+1}"
+        
+        # An ASCII domain can only contain Latin letters
+        if domain.isascii():
+            return False, None
+        
+        # Check for mixed-script attacks (different unicode ranges): Cyrillic and
+        # Greek letters are mapped to marker characters in one translate() pass
+        marked = set(domain.translate(_SCRIPT_TABLE))
+        domain_scripts = set()
+        if _CYRILLIC_MARK in marked:
+            domain_scripts.add('cyrillic')
+        if _GREEK_MARK in marked:
+            domain_scripts.add('greek')
+        if any(char.isalpha() for char in marked):
+            domain_scripts.add('latin')
+        
+        if len(domain_scripts) > 1:
+            return True, f"Mixed scripts detected: {', '.join(domain_scripts)}"
         
         return False, None
     
@@ -361,6 +619,22 @@ class LookalikeDomainDetector:
             'homoglyph_details': None
         }
     
+    def cache_clear(self):
+        """Drop memoized lookalike results"""
+        self._detect_cached.cache_clear()
+    
+    def is_trusted_host(self, url: str) -> bool:
+        """Check if the URL is the bare landing page of exactly a whitelisted brand domain"""
+        parsed = urlparse(url)
+        # Paths and queries on trusted hosts (open redirects, user content)
+        # still need the full analysis; only '/' with nothing after it is safe
+        if parsed.path not in ('', '/') or parsed.params or parsed.query or parsed.fragment:
+            return False
+        host = (parsed.hostname or '').lower()
+        if host.startswith('www.'):
+            host = host[4:]
+        return host in self._trusted_hosts
+    
     def get_all_brands(self) -> List[str]:
         """Get list of all protected brands"""
         all_brands = []
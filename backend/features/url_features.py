@@ -4,8 +4,12 @@ Extracts advanced features from URLs for phishing detection
 """
 import re
 import math
+import string
+import asyncio
 import ssl
 import socket
+import threading
+import time
 try:
     import whois
 except ImportError:
@@ -13,91 +17,209 @@ except ImportError:
         import python_whois as whois
     except ImportError:
         whois = None
-import tldextract
-from urllib.parse import urlparse, parse_qs
+import numpy as np
+from collections import Counter, OrderedDict
+from urllib.parse import urlparse, unquote, ParseResult
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Hashable, List, Mapping, Optional, Tuple
 import logging
 
+from config import get_settings
+from features.lookalike_detector import lookalike_detector
+from utils import domain_parts
+from utils.keyword_matcher import KeywordMatcher
+
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Dotted-quad IPv4 address anywhere in the URL
+_IP_RE = re.compile(
+    r'(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}'
+    r'([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])'
+)
+
+
+# Byte classes deleted by bytes.translate to count them in ASCII URLs
+_ASCII_DIGITS = string.digits.encode('ascii')
+_ASCII_LETTERS = string.ascii_letters.encode('ascii')
+
+# Keys of the URL-string features, in output order. Copying a prebuilt dict
+# and overwriting its values is cheaper than building a ~30-key literal per URL
+_URL_FEATURE_TEMPLATE = dict.fromkeys((
+    # Basic structure
+    'url', 'protocol', 'domain', 'domain_label', 'subdomain', 'path', 'query',
+    # Length features
+    'url_length', 'domain_length', 'path_length', 'subdomain_length',
+    # Structural features
+    'subdomain_count', 'path_depth', 'query_param_count',
+    # Character analysis
+    'digit_count', 'letter_count', 'special_char_count',
+    'hyphen_count', 'underscore_count', 'dot_count', 'slash_count', 'at_symbol',
+    # Ratios
+    'digit_ratio', 'special_char_ratio',
+    # Entropy
+    'url_entropy', 'domain_entropy',
+    # Suspicious patterns
+    'has_ip_address', 'has_suspicious_tld', 'suspicious_keyword_count',
+    'has_double_slash_redirecting', 'prefix_suffix_in_domain',
+    # Port analysis
+    'uses_non_standard_port', 'port',
+    # HTTPS
+    'is_https'
+))
+
+# Probe-free SSL/WHOIS features assumed for known-good registered domains
+KNOWN_GOOD_SSL_FEATURES = {
+    'has_valid_ssl': 1,
+    'ssl_certificate_age_days': 365,
+    'ssl_issuer_trusted': 1
+}
+KNOWN_GOOD_AGE_FEATURES = {
+    'domain_age_days': 3650,
+    'domain_registered_recently': 0
+}
+
+
+def _entropy_batch(texts: List[str]) -> List[float]:
+    """Shannon entropy of each text (rounded like _calculate_entropy), in one NumPy pass"""
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    
+    # Tag every code point with its text's index and count (text, char) pairs
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    owners = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    keys, counts = np.unique((owners << 21) | codes, return_counts=True)
+    key_owners = keys >> 21
+    
+    probabilities = counts / lengths[key_owners]
+    entropy = np.bincount(key_owners, weights=-probabilities * np.log2(probabilities), minlength=len(texts))
+    return [round(value, 4) for value in entropy.tolist()]
+
+
+class _ProbeCache:
+    """Thread-safe LRU of network probe results that expire after ttl seconds"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_or_probe(self, key: Hashable, probe: Callable[[Hashable], Any]) -> Any:
+        """Return the cached result for key, calling probe(key) on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                return entry[1]
+        
+        # Probe outside the lock so one slow host doesn't stall the others
+        value = probe(key)
+        
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+    
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
 
 
 class URLFeatureExtractor:
     """Extract comprehensive features from URLs"""
     
     def __init__(self):
+        # Bare suffixes, compared directly against tldextract's suffix
         self.suspicious_tlds = {
-            '.tk', '.ml', '.ga', '.cf', '.gq', '.xyz', '.top', '.work',
-            '.click', '.link', '.stream', '.download', '.loan', '.win'
+            'tk', 'ml', 'ga', 'cf', 'gq', 'xyz', 'top', 'work',
+            'click', 'link', 'stream', 'download', 'loan', 'win'
         }
         self.suspicious_keywords = {
             'verify', 'account', 'update', 'secure', 'banking', 'confirm',
             'login', 'signin', 'password', 'urgent', 'suspended', 'locked',
             'validate', 'restore', 'limited', 'unusual', 'activity'
         }
+        # All suspicious keywords found in a single automaton pass over the URL
+        self._keyword_matcher = KeywordMatcher(self.suspicious_keywords)
+        
+        # Raw SSL certificates and WHOIS creation dates per host; ages are
+        # computed from them on every call so cached entries never go stale
+        self._ssl_cache = _ProbeCache(settings.PROBE_CACHE_SIZE, settings.PROBE_CACHE_TTL)
+        self._whois_cache = _ProbeCache(settings.PROBE_CACHE_SIZE, settings.PROBE_CACHE_TTL)
+        
+        # Registered domains whose SSL/WHOIS probes are skipped
+        self.known_good_domains = self._load_known_good_domains()
+    
+    def _load_known_good_domains(self) -> frozenset:
+        """Whitelisted brand domains plus the optional KNOWN_GOOD_DOMAINS_FILE list"""
+        domains = {brand.lower() for brand in lookalike_detector.get_all_brands()}
+        
+        if settings.KNOWN_GOOD_DOMAINS_FILE:
+            try:
+                # One domain per line, or Tranco-style "rank,domain" rows
+                with open(settings.KNOWN_GOOD_DOMAINS_FILE, encoding='utf-8') as f:
+                    for line in f:
+                        domain = line.strip().rsplit(',', 1)[-1].lower()
+                        if domain:
+                            domains.add(domain)
+                logger.info(f"Loaded {len(domains)} known-good domains")
+            except OSError as e:
+                logger.warning(f"Could not load known-good domains from {settings.KNOWN_GOOD_DOMAINS_FILE}: {e}")
+        
+        return frozenset(domains)
     
     def extract_all_features(self, url: str) -> Dict[str, Any]:
         """Extract all URL features"""
+        return self._extract_features(url)
+    
+    def extract_all_features_batch(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """Extract all URL features for many URLs, computing domain entropy for the whole batch at once"""
+        results = [self._extract_features(url, domain_entropy=False) for url in urls]
+        
+        # Rows that failed extraction carry only the default features
+        extracted = [features for features in results if 'domain_label' in features]
+        entropies = _entropy_batch([features['domain_label'] for features in extracted])
+        for features, entropy in zip(extracted, entropies):
+            features['domain_entropy'] = entropy
+        
+        return results
+    
+    async def extract_all_features_async(self, url: str) -> Dict[str, Any]:
+        """Extract all URL features, running the SSL and WHOIS probes concurrently in worker threads"""
         try:
-            parsed = urlparse(url)
-            extracted = tldextract.extract(url)
-            
-            features = {
-                # Basic structure
-                'url': url,
-                'protocol': parsed.scheme,
-                'domain': extracted.domain + '.' + extracted.suffix,
-                'subdomain': extracted.subdomain,
-                'path': parsed.path,
-                'query': parsed.query,
-                
-                # Length features
-                'url_length': len(url),
-                'domain_length': len(extracted.domain),
-                'path_length': len(parsed.path),
-                'subdomain_length': len(extracted.subdomain) if extracted.subdomain else 0,
-                
-                # Structural features
-                'subdomain_count': len(extracted.subdomain.split('.')) if extracted.subdomain else 0,
-                'path_depth': len([p for p in parsed.path.split('/') if p]),
-                'query_param_count': len(parse_qs(parsed.query)),
-                
-                # Character analysis
-                'digit_count': sum(c.isdigit() for c in url),
-                'letter_count': sum(c.isalpha() for c in url),
-                'special_char_count': sum(not c.isalnum() for c in url),
-                'hyphen_count': url.count('-'),
-                'underscore_count': url.count('_'),
-                'dot_count': url.count('.'),
-                'slash_count': url.count('/'),
-                'at_symbol': 1 if '@' in url else 0,
-                
-                # Ratios
-                'digit_ratio': self._safe_ratio(sum(c.isdigit() for c in url), len(url)),
-                'special_char_ratio': self._safe_ratio(sum(not c.isalnum() for c in url), len(url)),
-                
-                # Entropy
-                'url_entropy': self._calculate_entropy(url),
-                'domain_entropy': self._calculate_entropy(extracted.domain),
-                
-                # Suspicious patterns
-                'has_ip_address': 1 if self._has_ip_address(url) else 0,
-                'has_suspicious_tld': 1 if '.' + extracted.suffix in self.suspicious_tlds else 0,
-                'suspicious_keyword_count': self._count_suspicious_keywords(url.lower()),
-                'has_double_slash_redirecting': 1 if url.count('//') > 1 else 0,
-                'prefix_suffix_in_domain': 1 if '-' in extracted.domain else 0,
-                
-                # Port analysis
-                'uses_non_standard_port': self._check_non_standard_port(url),
-                'port': parsed.port if parsed.port else (443 if parsed.scheme == 'https' else 80),
-                
-                # HTTPS
-                'is_https': 1 if parsed.scheme == 'https' else 0,
-            }
+            features, parsed, domain = self._extract_url_features(url)
+        except Exception as e:
+            logger.error(f"Error extracting features from {url}: {e}")
+            return self._get_default_features(url)
+        
+        if domain.lower() in self.known_good_domains:
+            features.update(self._known_good_features(parsed))
+            return features
+        
+        # Independent blocking I/O: wall-clock is max(ssl, whois), and the event loop stays free
+        ssl_features, age_features = await asyncio.gather(
+            asyncio.to_thread(self._extract_ssl_features, parsed),
+            asyncio.to_thread(self._extract_domain_age, domain)
+        )
+        features.update(ssl_features)
+        features.update(age_features)
+        return features
+    
+    def _extract_features(self, url: str, domain_entropy: bool = True) -> Dict[str, Any]:
+        """Extract all URL features, leaving domain_entropy at 0.0 unless domain_entropy"""
+        try:
+            features, parsed, domain = self._extract_url_features(url, domain_entropy)
             
             # Add advanced features (may be slower)
-            features.update(self._extract_ssl_features(url))
-            features.update(self._extract_domain_age(extracted.domain + '.' + extracted.suffix))
+            if domain.lower() in self.known_good_domains:
+                features.update(self._known_good_features(parsed))
+            else:
+                features.update(self._extract_ssl_features(parsed))
+                features.update(self._extract_domain_age(domain))
             
             return features
             
@@ -105,25 +227,133 @@ class URLFeatureExtractor:
             logger.error(f"Error extracting features from {url}: {e}")
             return self._get_default_features(url)
     
+    def _extract_url_features(
+        self,
+        url: str,
+        domain_entropy: bool = True
+    ) -> Tuple[Dict[str, Any], ParseResult, str]:
+        """
+        Compute the features derived from the URL string alone
+        
+        Returns:
+            (features, parsed URL, registered domain for WHOIS)
+        """
+        parsed = urlparse(url)
+        port = parsed.port  # parsed on each access; raises ValueError if out of range
+        extracted = domain_parts.extract(url)
+        
+        # One pass over the URL; every character statistic is read off the histogram
+        char_counts = Counter(url)
+        digit_count, letter_count, alnum_count = self._count_char_classes(url, char_counts)
+        special_char_count = len(url) - alnum_count
+        
+        features = _URL_FEATURE_TEMPLATE.copy()
+        # Basic structure
+        features['url'] = url
+        features['protocol'] = parsed.scheme
+        features['domain'] = extracted.domain + '.' + extracted.suffix
+        features['domain_label'] = extracted.domain
+        features['subdomain'] = extracted.subdomain
+        features['path'] = parsed.path
+        features['query'] = parsed.query
+        
+        # Length features
+        features['url_length'] = len(url)
+        features['domain_length'] = len(extracted.domain)
+        features['path_length'] = len(parsed.path)
+        features['subdomain_length'] = len(extracted.subdomain) if extracted.subdomain else 0
+        
+        # Structural features
+        features['subdomain_count'] = len(extracted.subdomain.split('.')) if extracted.subdomain else 0
+        features['path_depth'] = len([p for p in parsed.path.split('/') if p])
+        features['query_param_count'] = self._count_query_params(parsed.query) if parsed.query else 0
+        
+        # Character analysis
+        features['digit_count'] = digit_count
+        features['letter_count'] = letter_count
+        features['special_char_count'] = special_char_count
+        features['hyphen_count'] = char_counts['-']
+        features['underscore_count'] = char_counts['_']
+        features['dot_count'] = char_counts['.']
+        features['slash_count'] = char_counts['/']
+        features['at_symbol'] = 1 if '@' in char_counts else 0
+        
+        # Ratios
+        features['digit_ratio'] = self._safe_ratio(digit_count, len(url))
+        features['special_char_ratio'] = self._safe_ratio(special_char_count, len(url))
+        
+        # Entropy
+        features['url_entropy'] = self._entropy_from_counts(char_counts, len(url))
+        features['domain_entropy'] = self._calculate_entropy(extracted.domain) if domain_entropy else 0.0
+        
+        # Suspicious patterns
+        # A dotted quad needs at least 4 digits and 3 dots; the histogram rules
+        # out most URLs before the regex has to scan them
+        features['has_ip_address'] = 1 if (
+            digit_count >= 4 and char_counts['.'] >= 3 and self._has_ip_address(url)
+        ) else 0
+        features['has_suspicious_tld'] = 1 if extracted.suffix in self.suspicious_tlds else 0
+        features['suspicious_keyword_count'] = self._count_suspicious_keywords(url.lower())
+        features['has_double_slash_redirecting'] = 1 if url.count('//') > 1 else 0
+        features['prefix_suffix_in_domain'] = 1 if '-' in extracted.domain else 0
+        
+        # Port analysis
+        features['uses_non_standard_port'] = self._check_non_standard_port(port)
+        features['port'] = port if port else (443 if parsed.scheme == 'https' else 80)
+        
+        # HTTPS
+        features['is_https'] = 1 if parsed.scheme == 'https' else 0
+        
+        return features, parsed, features['domain']
+    
+    def _count_char_classes(self, url: str, char_counts: Mapping[str, int]) -> Tuple[int, int, int]:
+        """(digits, letters, alphanumerics) in url, as str.isdigit/isalpha/isalnum count them"""
+        if url.isascii():
+            # Deleting a class with bytes.translate runs in C; in ASCII every
+            # alphanumeric is a digit or a letter
+            data = url.encode('ascii')
+            digit_count = len(data) - len(data.translate(None, _ASCII_DIGITS))
+            letter_count = len(data) - len(data.translate(None, _ASCII_LETTERS))
+            return digit_count, letter_count, digit_count + letter_count
+        
+        # Unicode digits/letters (e.g. '²', 'é') need the str predicates
+        digit_count = letter_count = alnum_count = 0
+        for char, count in char_counts.items():
+            if char.isdigit():
+                digit_count += count
+            if char.isalpha():
+                letter_count += count
+            if char.isalnum():
+                alnum_count += count
+        return digit_count, letter_count, alnum_count
+    
     def _calculate_entropy(self, text: str) -> float:
         """Calculate Shannon entropy of text"""
-        if not text:
+        return self._entropy_from_counts(Counter(text), len(text))
+    
+    def _entropy_from_counts(self, counts: Mapping[str, int], text_len: int) -> float:
+        """Calculate Shannon entropy from a character histogram of a text of length text_len"""
+        if not text_len:
             return 0.0
         
-        # Count character frequencies
-        freq = {}
-        for char in text:
-            freq[char] = freq.get(char, 0) + 1
-        
-        # Calculate entropy
         entropy = 0.0
-        text_len = len(text)
-        for count in freq.values():
+        for count in counts.values():
             probability = count / text_len
             entropy -= probability * math.log2(probability)
         
         return round(entropy, 4)
     
+    def _count_query_params(self, query: str) -> int:
+        """Count distinct parameter names the way len(parse_qs(query)) does, without decoding values"""
+        # parse_qs drops fields without a value and merges names that decode alike
+        names = {
+            name for name, _, value in (field.partition('=') for field in query.split('&'))
+            if value
+        }
+        if '%' not in query and '+' not in query:
+            return len(names)
+        return len({unquote(name.replace('+', ' ')) for name in names})
+    
     def _safe_ratio(self, numerator: int, denominator: int) -> float:
         """Safely calculate ratio"""
         if denominator == 0:
@@ -132,26 +362,28 @@ class URLFeatureExtractor:
     
     def _has_ip_address(self, url: str) -> bool:
         """Check if URL contains IP address instead of domain"""
-        ip_pattern = re.compile(
-            r'(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}'
-            r'([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])'
-        )
-        return bool(ip_pattern.search(url))
+        return _IP_RE.search(url) is not None
     
     def _count_suspicious_keywords(self, url_lower: str) -> int:
         """Count suspicious keywords in URL"""
-        return sum(1 for keyword in self.suspicious_keywords if keyword in url_lower)
+        return self._keyword_matcher.count(url_lower)
     
-    def _check_non_standard_port(self, url: str) -> int:
-        """Check if URL uses non-standard port"""
-        parsed = urlparse(url)
-        if parsed.port:
+    def _check_non_standard_port(self, port: Optional[int]) -> int:
+        """Check if the URL's explicit port (parsed.port) is non-standard"""
+        if port:
             standard_ports = {80, 443, 8080}
-            return 0 if parsed.port in standard_ports else 1
+            return 0 if port in standard_ports else 1
         return 0
     
-    def _extract_ssl_features(self, url: str) -> Dict[str, Any]:
-        """Extract SSL certificate features"""
+    def _known_good_features(self, parsed: ParseResult) -> Dict[str, Any]:
+        """SSL/WHOIS features for a known-good domain, without probing it"""
+        # Plain-HTTP URLs still report no SSL (that path never probes)
+        features = dict(KNOWN_GOOD_SSL_FEATURES) if parsed.scheme == 'https' else self._extract_ssl_features(parsed)
+        features.update(KNOWN_GOOD_AGE_FEATURES)
+        return features
+    
+    def _extract_ssl_features(self, parsed: ParseResult) -> Dict[str, Any]:
+        """Extract SSL certificate features from an already-parsed URL"""
         features = {
             'has_valid_ssl': 0,
             'ssl_certificate_age_days': -1,
@@ -159,7 +391,6 @@ class URLFeatureExtractor:
         }
         
         try:
-            parsed = urlparse(url)
             if parsed.scheme != 'https':
                 return features
             
@@ -167,27 +398,36 @@ class URLFeatureExtractor:
             if not hostname:
                 return features
             
+            cert = self._ssl_cache.get_or_probe(hostname, self._fetch_ssl_certificate)
+            
+            if cert:
+                features['has_valid_ssl'] = 1
+                
+                # Calculate certificate age
+                not_before = datetime.strptime(cert['notBefore'], '%b %d %H:%M:%S %Y %Z')
+                age_days = (datetime.now() - not_before).days
+                features['ssl_certificate_age_days'] = age_days
+                
+                # Check if certificate is very new (< 30 days = suspicious)
+                features['ssl_issuer_trusted'] = 1 if age_days > 30 else 0
+        
+        except Exception as e:
+            logger.debug(f"SSL check failed for {parsed.geturl()}: {e}")
+        
+        return features
+    
+    def _fetch_ssl_certificate(self, hostname: str) -> Optional[Dict[str, Any]]:
+        """Get the SSL certificate of hostname:443 (None if the handshake fails)"""
+        try:
             # Get SSL certificate with timeout
             context = ssl.create_default_context()
             with socket.create_connection((hostname, 443), timeout=2) as sock:
                 with context.wrap_socket(sock, server_hostname=hostname) as ssock:
-                    cert = ssock.getpeercert()
-                    
-                    if cert:
-                        features['has_valid_ssl'] = 1
-                        
-                        # Calculate certificate age
-                        not_before = datetime.strptime(cert['notBefore'], '%b %d %H:%M:%S %Y %Z')
-                        age_days = (datetime.now() - not_before).days
-                        features['ssl_certificate_age_days'] = age_days
-                        
-                        # Check if certificate is very new (< 30 days = suspicious)
-                        features['ssl_issuer_trusted'] = 1 if age_days > 30 else 0
+                    return ssock.getpeercert()
         
         except Exception as e:
-            logger.debug(f"SSL check failed for {url}: {e}")
-        
-        return features
+            logger.debug(f"SSL handshake failed for {hostname}: {e}")
+            return None
     
     def _extract_domain_age(self, domain: str) -> Dict[str, Any]:
         """Extract domain registration age using WHOIS"""
@@ -201,10 +441,9 @@ class URLFeatureExtractor:
             return features
         
         try:
-            w = whois.whois(domain)
+            creation_date = self._whois_cache.get_or_probe(domain.lower(), self._fetch_creation_date)
             
-            if w.creation_date:
-                creation_date = w.creation_date
+            if creation_date:
                 # Handle list of dates
                 if isinstance(creation_date, list):
                     creation_date = creation_date[0]
@@ -220,6 +459,14 @@ class URLFeatureExtractor:
         
         return features
     
+    def _fetch_creation_date(self, domain: str) -> Any:
+        """Get the WHOIS creation date(s) of domain (None if the lookup fails)"""
+        try:
+            return whois.whois(domain).creation_date
+        except Exception as e:
+            logger.debug(f"WHOIS lookup failed for {domain}: {e}")
+            return None
+    
     def _get_default_features(self, url: str) -> Dict[str, Any]:
         """Return default features when extraction fails"""
         return {
@@ -4,14 +4,19 @@ Real-time Phishing Detection API
 """
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import time
 import logging
 
 from config import get_settings
 from api.v1 import router as api_v1_router
 from ml.model import ml_model
+from threatintel import threat_intelligence
+from utils.cache import threat_cache
 
 # Configure logging
 logging.basicConfig(
@@ -30,18 +35,35 @@ async def lifespan(app: FastAPI):
     logger.info(f"Starting {settings.APP_NAME} {settings.API_VERSION}")
     logger.info("Loading ML models...")
     
-    # Load ML models
+    # Load ML models (off the event loop; includes a warm-up prediction)
     try:
-        ml_model.load_models()
+        await asyncio.to_thread(ml_model.load_models)
         logger.info("✅ ML models loaded successfully")
     except Exception as e:
         logger.error(f"❌ Failed to load ML models: {e}")
         logger.warning("⚠️  API will run with degraded functionality (no ML scoring)")
     
+    # Bounded thread pool for blocking analysis work; installed as the loop's
+    # default executor so asyncio.to_thread() calls in the routes use it
+    executor = ThreadPoolExecutor(
+        max_workers=settings.MAX_WORKERS,
+        thread_name_prefix="analysis"
+    )
+    app.state.executor = executor
+    asyncio.get_running_loop().set_default_executor(executor)
+    logger.info(f"Analysis thread pool started ({settings.MAX_WORKERS} workers)")
+    
+    # Download the OpenPhish feed in the background and keep it refreshed
+    threat_intelligence.start_openphish_refresh()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down gracefully...")
+    threat_intelligence.stop_openphish_refresh()
+    await threat_intelligence.close_async()
+    threat_cache.stop_writer()
+    executor.shutdown(wait=False)
     # TODO: Close connections, save cache, cleanup
 
 
@@ -50,7 +72,8 @@ app = FastAPI(
     title=settings.APP_NAME,
     description="Real-time Phishing Detection and Prevention API",
     version=settings.MODEL_VERSION,
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS Configuration
@@ -68,6 +91,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger JSON bodies (full analysis results with every feature)
+app.add_middleware(GZipMiddleware, minimum_size=512)
+
 
 # Request timing middleware
 @app.middleware("http")
@@ -90,7 +116,7 @@ async def add_process_time_header(request: Request, call_next):
 async def global_exception_handler(request: Request, exc: Exception):
     """Handle uncaught exceptions"""
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal server error",
@@ -10,15 +10,122 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score
-from typing import Dict, Any, Tuple, Optional
+from scipy.special import expit
+from typing import Dict, Any, List, Tuple, Optional
 import logging
+import operator
 import time
 
+try:
+    import lz4  # noqa: F401 (enables joblib's lz4 compressor)
+    LZ4_AVAILABLE = True
+except ImportError:
+    LZ4_AVAILABLE = False
+
+try:
+    import lightgbm as lgb
+    LIGHTGBM_AVAILABLE = True
+except ImportError:
+    LIGHTGBM_AVAILABLE = False
+
 from config import get_settings
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Largest batch served by CompiledForest; past this sklearn's per-tree loop wins
+COMPILED_FOREST_MAX_ROWS = 256
+
+# joblib compression for saved models: lz4 decompresses about as fast as a raw
+# read, zlib is the stdlib fallback
+MODEL_COMPRESSION = ('lz4', 3) if LZ4_AVAILABLE else ('zlib', 3)
+
+# Feature value types numpy converts exactly as the isinstance check would
+_NUMERIC_TYPES = frozenset({int, float, bool})
+
+
+class CompiledForest:
+    """
+    Random Forest flattened into NumPy arrays; a prediction walks every tree
+    at once, one vectorized step per tree level
+    """
+    
+    def __init__(self, forest: RandomForestClassifier):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        
+        features, thresholds, lefts, rights, values = [], [], [], [], []
+        for offset, tree in zip(offsets, trees):
+            nodes = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left < 0
+            # Leaves point at themselves, so extra steps leave them in place
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, nodes, tree.children_left + offset))
+            rights.append(np.where(is_leaf, nodes, tree.children_right + offset))
+            # Per-tree class probabilities (scikit-learn >= 1.4 already stores
+            # fractions; older versions store weighted counts)
+            value = tree.value[:, 0, :]
+            normalizer = value.sum(axis=1, keepdims=True)
+            if not np.allclose(normalizer, 1.0):
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            values.append(value)
+        
+        self.roots = offsets.astype(np.intp)
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        self.value = np.concatenate(values)
+        self.max_depth = max(tree.max_depth for tree in trees)
+        self.n_trees = len(trees)
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities for each row of X, as forest.predict_proba"""
+        # Trees split on float32 inputs
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.repeat(self.roots[None, :], len(X), axis=0)
+        
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        
+        # Summed tree by tree (a strided reduction), as the forest accumulates them
+        return self.value[nodes].sum(axis=1) / self.n_trees
+
+
+class CompiledLogisticRegression:
+    """Binary Logistic Regression as a bare dot product + sigmoid"""
+    
+    def __init__(self, model: LogisticRegression):
+        if len(model.classes_) != 2:
+            raise ValueError("only binary models can be compiled")
+        self.coef_T = np.array(model.coef_.T)
+        self.intercept = np.array(model.intercept_)
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities for each row of X, as model.predict_proba"""
+        # Same operations as LinearClassifierMixin, minus input validation
+        prob = (np.asarray(X, dtype=float) @ self.coef_T + self.intercept).reshape(-1)
+        expit(prob, out=prob)
+        return np.stack([1 - prob, prob], axis=1)
+
+
+class LightGBMBooster:
+    """Saved LightGBM booster behind the classifier interface predict() uses"""
+    
+    def __init__(self, booster: "lgb.Booster"):
+        self.booster = booster
+        # Same importances LGBMClassifier(importance_type='gain') reports
+        self.feature_importances_ = booster.feature_importance(importance_type='gain')
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities for each row of X, as LGBMClassifier.predict_proba"""
+        prob = self.booster.predict(np.asarray(X, dtype=float))
+        return np.stack([1 - prob, prob], axis=1)
+
 
 class PhishingMLModel:
     """ML Model for phishing detection"""
@@ -26,6 +133,9 @@ class PhishingMLModel:
     def __init__(self):
         self.model_primary = None
         self.model_fallback = None
+        self._compiled_primary = None
+        self._compiled_fallback = None
+        self._top_feature_importance = []
         self.feature_names = []
         self.model_version = settings.MODEL_VERSION
         self.models_dir = settings.ML_MODEL_PATH
@@ -33,13 +143,32 @@ class PhishingMLModel:
         # Ensure models directory exists
         os.makedirs(self.models_dir, exist_ok=True)
     
-    def train(self, df: pd.DataFrame, target_column: str = 'label') -> Dict[str, Any]:
+    @property
+    def feature_names(self) -> List[str]:
+        """Model input features, in training column order"""
+        return self._feature_names
+    
+    @feature_names.setter
+    def feature_names(self, names: List[str]):
+        self._feature_names = list(names)
+        
+        # Reads every feature of a dict in one C-level call (always a tuple)
+        if len(self._feature_names) > 1:
+            self._feature_getter = operator.itemgetter(*self._feature_names)
+        elif self._feature_names:
+            only = self._feature_names[0]
+            self._feature_getter = lambda features: (features[only],)
+        else:
+            self._feature_getter = lambda features: ()
+    
+    def train(self, df: pd.DataFrame, target_column: str = 'label', run_cv: bool = False) -> Dict[str, Any]:
         """
         Train both primary and fallback models
         
         Args:
             df: DataFrame with features and target
             target_column: Name of target column (0=safe, 1=phishing)
+            run_cv: Also cross-validate both models (3-fold, on a 30% sample)
         
         Returns:
             Training metrics and performance
@@ -61,25 +190,43 @@ class PhishingMLModel:
         
         results = {}
         
-        # Train primary model (Random Forest)
-        logger.info("Training Random Forest (primary)...")
-        self.model_primary = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=20,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=42,
-            n_jobs=-1,
-            class_weight='balanced'
-        )
+        # Train primary model (Random Forest, or LightGBM when configured)
+        if self._use_lightgbm():
+            logger.info("Training LightGBM (primary)...")
+            primary_name = 'LightGBM'
+            # Shallow histogram-based trees: far fewer nodes to walk per prediction
+            self.model_primary = lgb.LGBMClassifier(
+                n_estimators=100,
+                max_depth=8,
+                num_leaves=31,
+                random_state=42,
+                n_jobs=-1,
+                class_weight='balanced',
+                importance_type='gain',
+                verbose=-1
+            )
+        else:
+            logger.info("Training Random Forest (primary)...")
+            primary_name = 'RandomForest'
+            self.model_primary = RandomForestClassifier(
+                n_estimators=100,
+                max_depth=20,
+                min_samples_split=5,
+                min_samples_leaf=2,
+                random_state=42,
+                n_jobs=-1,
+                class_weight='balanced'
+            )
         self.model_primary.fit(X_train, y_train)
+        self._compile_primary()
+        self._rank_feature_importance()
         
         # Evaluate primary model
         y_pred_primary = self.model_primary.predict(X_test)
         y_prob_primary = self.model_primary.predict_proba(X_test)[:, 1]
         
         results['primary'] = {
-            'model': 'RandomForest',
+            'model': primary_name,
             'accuracy': float(self.model_primary.score(X_test, y_test)),
             'auc_roc': float(roc_auc_score(y_test, y_prob_primary)),
             'classification_report': classification_report(y_test, y_pred_primary, output_dict=True),
@@ -99,6 +246,7 @@ class PhishingMLModel:
             n_jobs=-1
         )
         self.model_fallback.fit(X_train, y_train)
+        self._compile_fallback()
         
         # Evaluate fallback model
         y_pred_fallback = self.model_fallback.predict(X_test)
@@ -112,17 +260,21 @@ class PhishingMLModel:
             'confusion_matrix': confusion_matrix(y_test, y_pred_fallback).tolist()
         }
         
-        # Cross-validation
-        logger.info("Running cross-validation...")
-        cv_scores_primary = cross_val_score(self.model_primary, X, y, cv=5)
-        cv_scores_fallback = cross_val_score(self.model_fallback, X, y, cv=5)
-        
-        results['cross_validation'] = {
-            'primary_scores': cv_scores_primary.tolist(),
-            'primary_mean': float(cv_scores_primary.mean()),
-            'fallback_scores': cv_scores_fallback.tolist(),
-            'fallback_mean': float(cv_scores_fallback.mean())
-        }
+        # Cross-validation (opt-in: six extra fits, so only on a subsample)
+        if run_cv:
+            logger.info("Running cross-validation...")
+            cv_sample = df.sample(frac=0.3, random_state=42)
+            X_cv = cv_sample.drop(columns=[target_column])
+            y_cv = cv_sample[target_column]
+            cv_scores_primary = cross_val_score(self.model_primary, X_cv, y_cv, cv=3, n_jobs=-1)
+            cv_scores_fallback = cross_val_score(self.model_fallback, X_cv, y_cv, cv=3, n_jobs=-1)
+            
+            results['cross_validation'] = {
+                'primary_scores': cv_scores_primary.tolist(),
+                'primary_mean': float(cv_scores_primary.mean()),
+                'fallback_scores': cv_scores_fallback.tolist(),
+                'fallback_mean': float(cv_scores_fallback.mean())
+            }
         
         training_time = time.time() - start_time
         results['training_time_seconds'] = round(training_time, 2)
@@ -166,21 +318,14 @@ class PhishingMLModel:
             feature_vector = self._prepare_features(features)
             
             # Predict
-            prediction = model.predict_proba([feature_vector])[0]
+            prediction = self._predict_proba(model, feature_vector[None, :])[0]
             phishing_prob = float(prediction[1])  # Probability of class 1 (phishing)
             
             # Calculate confidence (distance from 0.5)
             confidence = abs(phishing_prob - 0.5) * 2
             
-            # Get feature importance (only for primary model)
-            feature_importance = []
-            if not use_fallback and hasattr(model, 'feature_importances_'):
-                importances = model.feature_importances_
-                feature_importance = sorted(
-                    zip(self.feature_names, importances),
-                    key=lambda x: x[1],
-                    reverse=True
-                )[:10]  # Top 10
+            # Get feature importance (only for primary model; ranked at load time)
+            feature_importance = [] if use_fallback else list(self._top_feature_importance)
             
             inference_time = (time.time() - start_time) * 1000  # Convert to ms
             
@@ -188,7 +333,7 @@ class PhishingMLModel:
                 'ml_prediction': round(phishing_prob, 4),
                 'confidence': round(confidence, 4),
                 'model_used': model_name,
-                'feature_importance': [(name, round(float(imp), 4)) for name, imp in feature_importance],
+                'feature_importance': feature_importance,
                 'inference_time_ms': round(inference_time, 2)
             }
             
@@ -200,30 +345,115 @@ class PhishingMLModel:
                 return self.predict(features, use_fallback=True)
             raise
     
+    def predict_batch(self, feature_dicts: List[Dict[str, Any]], use_fallback: bool = False) -> np.ndarray:
+        """
+        Predict phishing probabilities for many feature dicts in one
+        predict_proba call
+        
+        Returns:
+            np.ndarray of phishing probabilities (0-1), one per input
+        """
+        model = self.model_fallback if use_fallback else self.model_primary
+        if model is None:
+            # Same failover as predict, either direction
+            model = self.model_primary if use_fallback else self.model_fallback
+        if model is None:
+            raise ValueError("No model loaded")
+        
+        # (N, F) matrix filled row by row; float64 like the single-row path
+        X = np.zeros((len(feature_dicts), len(self.feature_names)))
+        for row, features in enumerate(feature_dicts):
+            X[row] = self._prepare_features(features)
+        
+        if not len(X):
+            return np.zeros(0)
+        return self._predict_proba(model, X)[:, 1]
+    
+    def _predict_proba(self, model, X: np.ndarray) -> np.ndarray:
+        """predict_proba, served by the compiled models where available"""
+        if model is self.model_primary and self._compiled_primary is not None and len(X) <= COMPILED_FOREST_MAX_ROWS:
+            return self._compiled_primary.predict_proba(X)
+        if model is self.model_fallback and self._compiled_fallback is not None:
+            return self._compiled_fallback.predict_proba(X)
+        return model.predict_proba(X)
+    
+    def _use_lightgbm(self) -> bool:
+        """Whether the primary model is configured as LightGBM (and it is installed)"""
+        if settings.PRIMARY_MODEL_TYPE != 'lightgbm':
+            return False
+        if not LIGHTGBM_AVAILABLE:
+            logger.warning("PRIMARY_MODEL_TYPE is lightgbm but lightgbm is not installed, using Random Forest")
+            return False
+        return True
+    
+    def _rank_feature_importance(self):
+        """Cache the primary model's top 10 (feature, importance) pairs reported by predict()"""
+        # A forest's feature_importances_ is recomputed from every tree on each access
+        self._top_feature_importance = []
+        if hasattr(self.model_primary, 'feature_importances_'):
+            ranked = sorted(
+                zip(self.feature_names, self.model_primary.feature_importances_),
+                key=lambda x: x[1],
+                reverse=True
+            )[:10]  # Top 10
+            self._top_feature_importance = [(name, round(float(imp), 4)) for name, imp in ranked]
+    
+    def _compile_primary(self):
+        """Flatten the primary Random Forest for fast small-batch inference"""
+        self._compiled_primary = None
+        if isinstance(self.model_primary, RandomForestClassifier):
+            try:
+                self._compiled_primary = CompiledForest(self.model_primary)
+            except Exception as e:
+                logger.warning(f"Could not compile primary model, using scikit-learn inference: {e}")
+    
+    def _compile_fallback(self):
+        """Reduce the fallback Logistic Regression to its coefficients"""
+        self._compiled_fallback = None
+        if isinstance(self.model_fallback, LogisticRegression):
+            try:
+                self._compiled_fallback = CompiledLogisticRegression(self.model_fallback)
+            except Exception as e:
+                logger.warning(f"Could not compile fallback model, using scikit-learn inference: {e}")
+    
     def _prepare_features(self, features: Dict[str, Any]) -> np.ndarray:
         """Convert feature dict to numpy array matching training features"""
         # Extract features in correct order
-        feature_vector = []
-        for feature_name in self.feature_names:
-            value = features.get(feature_name, 0)
-            # Handle potential type issues
-            if isinstance(value, (int, float)):
-                feature_vector.append(value)
-            else:
-                feature_vector.append(0)
-        
-        return np.array(feature_vector)
+        try:
+            values = self._feature_getter(features)
+        except KeyError:
+            values = [features.get(feature_name, 0) for feature_name in self._feature_names]
+        
+        # Handle potential type issues (only when something isn't a plain number)
+        if not _NUMERIC_TYPES.issuperset(map(type, values)):
+            values = [value if isinstance(value, (int, float)) else 0 for value in values]
+        
+        return np.fromiter(values, dtype=float, count=len(values))
+    
+    def warm_up(self):
+        """Run one throwaway prediction per loaded model so the first request doesn't pay first-call costs"""
+        for use_fallback, model in ((False, self.model_primary), (True, self.model_fallback)):
+            if model is not None and self.feature_names:
+                try:
+                    self._predict_proba(model, np.zeros((1, len(self.feature_names))))
+                except Exception as e:
+                    logger.warning(f"Model warm-up failed: {e}")
     
     def save_models(self):
         """Save trained models to disk"""
-        if self.model_primary:
+        if LIGHTGBM_AVAILABLE and isinstance(self.model_primary, lgb.LGBMClassifier):
+            # Native text format: loads faster than an unpickled classifier
+            primary_path = os.path.join(self.models_dir, f'lightgbm_{self.model_version}.txt')
+            self.model_primary.booster_.save_model(primary_path)
+            logger.info(f"Primary model saved to {primary_path}")
+        elif self.model_primary:
             primary_path = os.path.join(self.models_dir, f'random_forest_{self.model_version}.joblib')
-            joblib.dump(self.model_primary, primary_path)
+            joblib.dump(self.model_primary, primary_path, compress=MODEL_COMPRESSION, protocol=5)
             logger.info(f"Primary model saved to {primary_path}")
         
         if self.model_fallback:
             fallback_path = os.path.join(self.models_dir, f'logistic_regression_{self.model_version}.joblib')
-            joblib.dump(self.model_fallback, fallback_path)
+            joblib.dump(self.model_fallback, fallback_path, compress=MODEL_COMPRESSION, protocol=5)
             logger.info(f"Fallback model saved to {fallback_path}")
         
         # Save feature names
@@ -234,22 +464,31 @@ class PhishingMLModel:
     def load_models(self):
         """Load trained models from disk"""
         try:
+            lightgbm_path = os.path.join(self.models_dir, f'lightgbm_{self.model_version}.txt')
             primary_path = os.path.join(self.models_dir, f'random_forest_{self.model_version}.joblib')
             fallback_path = os.path.join(self.models_dir, f'logistic_regression_{self.model_version}.joblib')
             features_path = os.path.join(self.models_dir, f'feature_names_{self.model_version}.joblib')
             
-            if os.path.exists(primary_path):
+            if self._use_lightgbm() and os.path.exists(lightgbm_path):
+                self.model_primary = LightGBMBooster(lgb.Booster(model_file=lightgbm_path))
+                self._compile_primary()
+                logger.info(f"Primary model loaded from {lightgbm_path}")
+            elif os.path.exists(primary_path):
                 self.model_primary = joblib.load(primary_path)
+                self._compile_primary()
                 logger.info(f"Primary model loaded from {primary_path}")
             
             if os.path.exists(fallback_path):
                 self.model_fallback = joblib.load(fallback_path)
+                self._compile_fallback()
                 logger.info(f"Fallback model loaded from {fallback_path}")
             
             if os.path.exists(features_path):
                 self.feature_names = joblib.load(features_path)
                 logger.info(f"Feature names loaded: {len(self.feature_names)} features")
             
+            self._rank_feature_importance()
+            self.warm_up()
             return True
             
         except Exception as e:
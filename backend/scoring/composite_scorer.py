@@ -2,8 +2,13 @@
 Composite Scoring Engine
 Combines ML, heuristic, threat intel, and lookalike scores with explanation
 """
-from typing import Dict, Any, List, Tuple
-from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from bisect import bisect_left
+from operator import itemgetter
+import heapq
+from datetime import datetime, timezone
+from functools import lru_cache
+import numpy as np
 import logging
 
 from config import get_settings
@@ -11,6 +16,137 @@ from config import get_settings
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# (risk level, recommendation, color), indexed by the number of thresholds
+# (safe, suspicious, dangerous) a score exceeds
+RISK_TABLE = (
+    ('safe', 'allow', 'green'),
+    ('suspicious', 'warn', 'yellow'),
+    ('dangerous', 'block', 'orange'),
+    ('critical', 'block', 'red')
+)
+# Score sources, in the order of calculate_score's weights and contributions
+CONTRIBUTION_SOURCES = ('ml', 'heuristic', 'threat_intel', 'lookalike')
+
+RISK_LEVELS = tuple(level for level, _, _ in RISK_TABLE)
+RECOMMENDATIONS = {level: recommendation for level, recommendation, _ in RISK_TABLE}
+RISK_COLORS = {level: color for level, _, color in RISK_TABLE}
+
+
+# Weights (ml, heuristic, threat intel, lookalike) used for a high-confidence lookalike
+ADAPTIVE_LOOKALIKE_WEIGHTS = (0.20, 0.25, 0.20, 0.35)
+# Configured weights in the same order, read from settings once at import
+DEFAULT_WEIGHTS = (
+    settings.WEIGHT_ML,
+    settings.WEIGHT_HEURISTIC,
+    settings.WEIGHT_THREAT_INTEL,
+    settings.WEIGHT_LOOKALIKE
+)
+_W = np.array(DEFAULT_WEIGHTS, dtype=np.float64)
+_RISK_LEVEL_NAMES = np.array(RISK_LEVELS)
+
+
+def _apply_rules(
+    ml_score_normalized: float,
+    heuristic_score: int,
+    threat_intel_score: int,
+    lookalike_score: int,
+    is_lookalike: bool,
+    homoglyph_detected: bool,
+    weights: Tuple[float, float, float, float],
+    threshold_suspicious: int
+) -> Tuple[int, Tuple[float, float, float, float], bool]:
+    """Adaptive weighting and lookalike override on plain scalars: (score, weights used, is_phishing)"""
+    # Adaptive weighting: if high-confidence lookalike detected, redistribute
+    # weights (lookalike up to 35%, ML down to 20%)
+    if is_lookalike and lookalike_score >= 90:
+        weights = ADAPTIVE_LOOKALIKE_WEIGHTS
+    weight_ml, weight_heuristic, weight_threat_intel, weight_lookalike = weights
+    
+    # Calculate weighted composite score
+    composite_score = (
+        (ml_score_normalized * weight_ml) +
+        (heuristic_score * weight_heuristic) +
+        (threat_intel_score * weight_threat_intel) +
+        (lookalike_score * weight_lookalike)
+    )
+    
+    # Clamp to 0-100
+    composite_score = max(0, min(100, int(composite_score)))
+    
+    # Determine if phishing (threshold-based OR high-confidence lookalike)
+    is_phishing = composite_score >= threshold_suspicious
+    
+    # Override: High-confidence lookalike with evidence = phishing
+    # Rule 1: High lookalike (≥80) + moderate heuristic (≥50); this also covers
+    #         very high lookalike (≥90) + heuristic ≥60, so that case needs no test
+    # Rule 2: Lookalike ≥75 + homoglyphs
+    if (is_lookalike and
+        ((lookalike_score >= 80 and heuristic_score >= 50) or
+         (lookalike_score >= 75 and homoglyph_detected))):
+        is_phishing = True
+        # Boost score to at least "dangerous" threshold
+        composite_score = max(composite_score, threshold_suspicious + 10)
+    
+    return composite_score, weights, is_phishing
+
+
+@lru_cache(maxsize=4096)
+def _score_core(
+    ml_score: float,
+    heuristic_score: int,
+    threat_intel_score: int,
+    lookalike_score: int,
+    is_lookalike: bool,
+    homoglyph_detected: bool,
+    weights: Tuple[float, float, float, float],
+    thresholds: Tuple[int, int, int]
+) -> Tuple[int, Tuple[float, float, float, float], bool, str, str]:
+    """
+    Numeric half of calculate_score, memoized since extension traffic rescores
+    the same URLs: (score, contributions, is_phishing, risk level, recommendation)
+    """
+    # Normalize ML score to 0-100
+    ml_score_normalized = ml_score * 100
+    
+    composite_score, weights, is_phishing = _apply_rules(
+        ml_score_normalized,
+        heuristic_score,
+        threat_intel_score,
+        lookalike_score,
+        is_lookalike,
+        homoglyph_detected,
+        weights,
+        thresholds[1]
+    )
+    weight_ml, weight_heuristic, weight_threat_intel, weight_lookalike = weights
+    
+    # Per-source contributions, in CONTRIBUTION_SOURCES order
+    contributions = (
+        ml_score_normalized * weight_ml,
+        heuristic_score * weight_heuristic,
+        threat_intel_score * weight_threat_intel,
+        lookalike_score * weight_lookalike
+    )
+    
+    # Determine risk level and recommendation
+    risk_level, recommendation, _ = RISK_TABLE[bisect_left(thresholds, composite_score)]
+    
+    return composite_score, contributions, is_phishing, risk_level, recommendation
+
+
+@lru_cache(maxsize=1024)
+def _lookalike_reason(brand: Optional[str], homoglyph: Optional[str]) -> str:
+    """Reason text for a lookalike domain (brands recur, so formatted once each)"""
+    if homoglyph:
+        return f"Lookalike domain: {homoglyph} (impersonating {brand})"
+    return f"Lookalike domain detected: similar to {brand}"
+
+
+@lru_cache(maxsize=1024)
+def _impersonation_reason(brand: str) -> str:
+    """Reason text for a page impersonating brand"""
+    return f"Page is impersonating {brand.title()}"
+
 
 class CompositeScorer:
     """Calculate final threat score and generate explanations"""
@@ -26,6 +162,9 @@ class CompositeScorer:
         self.threshold_safe = settings.THRESHOLD_SAFE  # 30
         self.threshold_suspicious = settings.THRESHOLD_SUSPICIOUS  # 60
         self.threshold_dangerous = settings.THRESHOLD_DANGEROUS  # 85
+        
+        # Read once per scorer rather than attribute by attribute per call
+        self._thresholds = (self.threshold_safe, self.threshold_suspicious, self.threshold_dangerous)
     
     def calculate_score(
         self,
@@ -52,76 +191,50 @@ class CompositeScorer:
         
         Returns comprehensive analysis with explanations
         """
-        # Normalize ML score to 0-100
-        ml_score_normalized = ml_score * 100
-        
-        # Adaptive weighting: Boost lookalike weight when high-confidence detection
-        weight_ml = self.weight_ml
-        weight_heuristic = self.weight_heuristic
-        weight_threat_intel = self.weight_threat_intel
-        weight_lookalike = self.weight_lookalike
-        
-        # If high-confidence lookalike detected, redistribute weights
-        if lookalike_details.get('is_lookalike', False) and lookalike_score >= 90:
-            # Increase lookalike weight to 35%, reduce ML to 20%
-            weight_lookalike = 0.35
-            weight_ml = 0.20
-            weight_heuristic = 0.25
-            weight_threat_intel = 0.20
+        # Read each details field once
+        is_lookalike = lookalike_details.get('is_lookalike', False)
+        threat_intel_hits = threat_intel_details.get('hits', 0)
+        if brand_impersonation_details:
+            is_impersonating = brand_impersonation_details.get('is_impersonating', False)
+            impersonated_brand = brand_impersonation_details.get('suspected_brand')
+        else:
+            is_impersonating = False
+            impersonated_brand = None
         
-        # Calculate weighted composite score
-        composite_score = (
-            (ml_score_normalized * weight_ml) +
-            (heuristic_score * weight_heuristic) +
-            (threat_intel_score * weight_threat_intel) +
-            (lookalike_score * weight_lookalike)
+        composite_score, contributions, is_phishing, risk_level, recommendation = _score_core(
+            ml_score,
+            heuristic_score,
+            threat_intel_score,
+            lookalike_score,
+            is_lookalike,
+            lookalike_details.get('homoglyph_detected', False),
+            DEFAULT_WEIGHTS,
+            self._thresholds
         )
         
-        # Clamp to 0-100
-        composite_score = max(0, min(100, int(composite_score)))
-        
-        # Determine risk level
-        risk_level = self._get_risk_level(composite_score)
-        
-        # Determine if phishing (threshold-based OR high-confidence lookalike)
-        is_phishing = composite_score >= self.threshold_suspicious
-        
-        # Override: High-confidence lookalike with evidence = phishing
-        # Rule 1: Very high lookalike (≥90) + moderate heuristic (≥60)
-        # Rule 2: High lookalike (≥80) + high heuristic (≥70) + homoglyphs
-        if (lookalike_details.get('is_lookalike', False) and 
-            ((lookalike_score >= 90 and heuristic_score >= 60) or
-             (lookalike_score >= 80 and heuristic_score >= 50) or
-             (lookalike_score >= 75 and lookalike_details.get('homoglyph_detected', False)))):
-            is_phishing = True
-            # Boost score to at least "dangerous" threshold
-            composite_score = max(composite_score, self.threshold_suspicious + 10)
-            risk_level = self._get_risk_level(composite_score)
-        
         # Calculate confidence
         confidence = self._calculate_confidence(
             ml_details.get('confidence', 0),
-            threat_intel_details.get('hits', 0),
-            lookalike_details.get('is_lookalike', False)
+            threat_intel_hits,
+            is_lookalike
         )
         
         # Generate reasons
         reasons = self._generate_reasons(
             composite_score,
+            contributions,
             ml_score,
             heuristic_score,
-            threat_intel_score,
-            lookalike_score,
-            heuristic_details,
-            threat_intel_details,
+            heuristic_details.get('matched_rules'),
+            threat_intel_details.get('reasons'),
+            threat_intel_details.get('reason_sources'),
+            is_lookalike,
             lookalike_details,
-            brand_impersonation_details
+            brand_impersonation_details if is_impersonating else None
         )
         
-        # Get recommendation
-        recommendation = self._get_recommendation(risk_level, is_phishing)
-        
-        # Build comprehensive response
+        # Build comprehensive response (a fresh dict per call: the literal costs
+        # the same as filling a copied template, and callers keep the result)
         result = {
             'threat_score': composite_score,
             'risk_level': risk_level,
@@ -130,37 +243,115 @@ class CompositeScorer:
             'recommendation': recommendation,
             'analysis': {
                 'ml_prediction': round(ml_score, 4),
-                'ml_contribution': round(ml_score_normalized * weight_ml, 2),
+                'ml_contribution': round(contributions[0], 2),
                 'heuristic_score': heuristic_score,
-                'heuristic_contribution': round(heuristic_score * weight_heuristic, 2),
+                'heuristic_contribution': round(contributions[1], 2),
                 'threat_intel_score': threat_intel_score,
-                'threat_intel_contribution': round(threat_intel_score * weight_threat_intel, 2),
-                'threat_intel_hits': threat_intel_details.get('hits', 0),
-                'lookalike_detected': lookalike_details.get('is_lookalike', False),
+                'threat_intel_contribution': round(contributions[2], 2),
+                'threat_intel_hits': threat_intel_hits,
+                'lookalike_detected': is_lookalike,
                 'lookalike_score': lookalike_score,
-                'lookalike_contribution': round(lookalike_score * weight_lookalike, 2),
+                'lookalike_contribution': round(contributions[3], 2),
                 'lookalike_brand': lookalike_details.get('matched_brand'),
-                'brand_impersonation': brand_impersonation_details.get('is_impersonating', False) if brand_impersonation_details else False,
-                'impersonated_brand': brand_impersonation_details.get('suspected_brand') if brand_impersonation_details else None,
+                'brand_impersonation': is_impersonating,
+                'impersonated_brand': impersonated_brand,
                 'reasons': reasons,
                 'model_used': ml_details.get('model_used', 'primary'),
                 'inference_time_ms': ml_details.get('inference_time_ms', 0)
             },
-            'timestamp': datetime.now().isoformat()
+            # Left as a datetime: ORJSONResponse writes the ISO string natively,
+            # so no Python-side isoformat() runs per request
+            'timestamp': datetime.now(timezone.utc)
         }
         
         return result
     
+    def calculate_score_batch(
+        self,
+        scores: np.ndarray,
+        weights: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Weighted composite scores and risk levels for many URLs at once
+        
+        Args:
+            scores: (N, 4) array of [ML prediction (0-1), heuristic, threat intel, lookalike]
+            weights: (4,) weights, or (N, 4) per-row weights (e.g. the adaptive
+                lookalike weights); defaults to the configured weights
+        
+        Returns:
+            (threat scores as int64 clamped to 0-100, risk level strings);
+            the single-URL lookalike override is left to calculate_score
+        """
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1, 4)
+        if weights is None:
+            weights = _W
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), scores.shape)
+        
+        # Column by column in calculate_score's order (not a BLAS dot, whose FMA
+        # and summation order can move a score across an integer boundary)
+        composite = scores[:, 0] * 100 * weights[:, 0]
+        composite += scores[:, 1] * weights[:, 1]
+        composite += scores[:, 2] * weights[:, 2]
+        composite += scores[:, 3] * weights[:, 3]
+        
+        # int() truncation, then clamp to 0-100
+        threat_scores = np.clip(composite.astype(np.int64), 0, 100)
+        
+        risk_levels = _RISK_LEVEL_NAMES[np.searchsorted(self._thresholds, threat_scores, side='left')]
+        return threat_scores, risk_levels
+    
+    def build_prefilter_result(
+        self,
+        threat_score: int,
+        is_phishing: bool,
+        prefilter: str,
+        reasons: List[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Build a minimal analysis result for URLs decided by the allow/deny
+        prefilter, in the same shape as calculate_score()
+        """
+        risk_level, recommendation, _ = self._get_risk_row(threat_score)
+        
+        return {
+            'threat_score': threat_score,
+            'risk_level': risk_level,
+            'is_phishing': is_phishing,
+            'confidence': 0.95,
+            'recommendation': recommendation,
+            # Full analysis shape with neutral values (no analyzer ran), so
+            # consumers can read every field as for a full analysis
+            'analysis': {
+                'ml_prediction': 0.0,
+                'ml_contribution': 0.0,
+                'heuristic_score': 0,
+                'heuristic_contribution': 0.0,
+                'threat_intel_score': 0,
+                'threat_intel_contribution': 0.0,
+                'threat_intel_hits': 0,
+                'lookalike_detected': False,
+                'lookalike_score': 0,
+                'lookalike_contribution': 0.0,
+                'lookalike_brand': None,
+                'brand_impersonation': False,
+                'impersonated_brand': None,
+                'reasons': reasons or [],
+                'model_used': 'prefilter',
+                'inference_time_ms': 0,
+                'prefilter': prefilter
+            },
+            'timestamp': datetime.now(timezone.utc)
+        }
+    
+    def _get_risk_row(self, score: int) -> Tuple[str, str, str]:
+        """(risk level, recommendation, color) for a score"""
+        # Each threshold is the top of its band (score <= threshold)
+        return RISK_TABLE[bisect_left(self._thresholds, score)]
+    
     def _get_risk_level(self, score: int) -> str:
         """Determine risk level from score"""
-        if score <= self.threshold_safe:
-            return 'safe'
-        elif score <= self.threshold_suspicious:
-            return 'suspicious'
-        elif score <= self.threshold_dangerous:
-            return 'dangerous'
-        else:
-            return 'critical'
+        return self._get_risk_row(score)[0]
     
     def _calculate_confidence(
         self,
@@ -184,60 +375,62 @@ class CompositeScorer:
     def _generate_reasons(
         self,
         composite_score: int,
+        contributions: Tuple[float, float, float, float],
         ml_score: float,
         heuristic_score: int,
-        threat_intel_score: int,
-        lookalike_score: int,
-        heuristic_details: Dict,
-        threat_intel_details: Dict,
+        matched_rules: Optional[List[Dict[str, Any]]],
+        threat_intel_reasons: Optional[List[str]],
+        threat_intel_sources: Optional[List[str]],
+        is_lookalike: bool,
         lookalike_details: Dict,
-        brand_impersonation_details: Dict = None
+        impersonation_details: Dict = None
     ) -> List[Dict[str, Any]]:
-        """Generate ranked list of threat reasons"""
+        """
+        Generate ranked list of threat reasons from calculate_score's per-source
+        contributions (impersonation_details only when the page is impersonating)
+        """
         reasons = []
         
-        # Calculate contributions
-        ml_contribution = (ml_score * 100) * self.weight_ml
-        heuristic_contribution = heuristic_score * self.weight_heuristic
-        threat_intel_contribution = threat_intel_score * self.weight_threat_intel
-        lookalike_contribution = lookalike_score * self.weight_lookalike
-        
-        contributions = [
-            ('ml', ml_contribution),
-            ('heuristic', heuristic_contribution),
-            ('threat_intel', threat_intel_contribution),
-            ('lookalike', lookalike_contribution)
-        ]
+        # Add brand impersonation if detected (first, so it leads its weight ties)
+        if impersonation_details:
+            reasons.append({
+                'factor': _impersonation_reason(impersonation_details.get('suspected_brand', 'unknown brand')),
+                'severity': 'critical',
+                'weight': impersonation_details.get('impersonation_score', 0),
+                'source': 'brand_impersonation'
+            })
         
         # Sort by contribution
-        contributions.sort(key=lambda x: x[1], reverse=True)
+        ranked = sorted(zip(CONTRIBUTION_SOURCES, contributions), key=lambda x: x[1], reverse=True)
         
         # Add reasons based on contribution
-        for source, contribution in contributions:
+        for source, contribution in ranked:
             if contribution < 5:  # Skip negligible contributions
                 continue
             
             weight_percent = int((contribution / composite_score) * 100) if composite_score > 0 else 0
             severity = self._get_severity_from_contribution(weight_percent)
             
-            if source == 'threat_intel' and threat_intel_details.get('reasons'):
+            if source == 'threat_intel' and threat_intel_reasons:
                 # Add threat intel reasons
-                for reason_text in threat_intel_details['reasons'][:3]:
+                top_reasons = threat_intel_reasons[:3]
+                if threat_intel_sources is None:
+                    # Untagged reasons (not from check_all): recognize the feed by name
+                    threat_intel_sources = ['openphish' if 'OpenPhish' in reason_text else None for reason_text in top_reasons]
+                for reason_text, reason_source in zip(top_reasons, threat_intel_sources):
                     reasons.append({
                         'factor': reason_text,
-                        'severity': 'critical' if 'OpenPhish' in reason_text else 'high',
+                        'severity': 'critical' if reason_source == 'openphish' else 'high',
                         'weight': weight_percent,
                         'source': 'threat_intelligence'
                     })
             
-            elif source == 'lookalike' and lookalike_details.get('is_lookalike'):
+            elif source == 'lookalike' and is_lookalike:
                 # Add lookalike reason
-                brand = lookalike_details.get('matched_brand', 'unknown brand')
-                homoglyph = lookalike_details.get('homoglyph_details')
-                
-                reason_text = f"Lookalike domain detected: similar to {brand}"
-                if homoglyph:
-                    reason_text = f"Lookalike domain: {homoglyph} (impersonating {brand})"
+                reason_text = _lookalike_reason(
+                    lookalike_details.get('matched_brand', 'unknown brand'),
+                    lookalike_details.get('homoglyph_details')
+                )
                 
                 reasons.append({
                     'factor': reason_text,
@@ -246,9 +439,9 @@ class CompositeScorer:
                     'source': 'lookalike_detection'
                 })
             
-            elif source == 'heuristic' and heuristic_details.get('matched_rules'):
+            elif source == 'heuristic' and matched_rules:
                 # Add top heuristic rules
-                for rule in heuristic_details['matched_rules'][:3]:
+                for rule in matched_rules[:3]:
                     reasons.append({
                         'factor': rule['explanation'],
                         'severity': rule['severity'],
@@ -266,19 +459,12 @@ class CompositeScorer:
                     'source': 'machine_learning'
                 })
         
-        # Add brand impersonation if detected
-        if brand_impersonation_details and brand_impersonation_details.get('is_impersonating'):
-            brand = brand_impersonation_details.get('suspected_brand', 'unknown brand')
-            reasons.insert(0, {
-                'factor': f"Page is impersonating {brand.title()}",
-                'severity': 'critical',
-                'weight': brand_impersonation_details.get('impersonation_score', 0),
-                'source': 'brand_impersonation'
-            })
-        
-        # Sort by weight (descending) and limit to top 10
-        reasons.sort(key=lambda x: x['weight'], reverse=True)
-        return reasons[:10]
+        # Sort by weight (descending) and limit to top 10; at most 9 reasons
+        # are built today, so the common case sorts in place without a copy
+        if len(reasons) > 10:
+            return heapq.nlargest(10, reasons, key=itemgetter('weight'))
+        reasons.sort(key=itemgetter('weight'), reverse=True)
+        return reasons
     
     def _get_severity_from_contribution(self, weight_percent: int) -> str:
         """Get severity level from contribution percentage"""
@@ -293,23 +479,11 @@ class CompositeScorer:
     
     def _get_recommendation(self, risk_level: str, is_phishing: bool) -> str:
         """Get action recommendation based on risk level"""
-        recommendations = {
-            'safe': 'allow',
-            'suspicious': 'warn',
-            'dangerous': 'block',
-            'critical': 'block'
-        }
-        return recommendations.get(risk_level, 'warn')
+        return RECOMMENDATIONS.get(risk_level, 'warn')
     
     def get_risk_color(self, risk_level: str) -> str:
         """Get color code for risk level"""
-        colors = {
-            'safe': 'green',
-            'suspicious': 'yellow',
-            'dangerous': 'orange',
-            'critical': 'red'
-        }
-        return colors.get(risk_level, 'gray')
+        return RISK_COLORS.get(risk_level, 'gray')
 
 
 # Global instance
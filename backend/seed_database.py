@@ -3,10 +3,12 @@ PhishGuard AI - Sample Data Seeding Script
 Generates realistic threat data for dashboard demo
 """
 
-import random
-import json
+import asyncio
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
+import numpy as np
+import orjson
+import requests
 from supabase import create_client, Client
 
 # Supabase Configuration
@@ -15,6 +17,15 @@ SUPABASE_KEY = "sb_secret_S7n2lcA9xvkqlGzo2fq08g_bV8_EAZd"  # Use service key fo
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Bulk inserts go straight to the PostgREST endpoint with orjson-encoded bodies
+REST_URL = f"{SUPABASE_URL}/rest/v1"
+REST_HEADERS = {
+    'apikey': SUPABASE_KEY,
+    'Authorization': f'Bearer {SUPABASE_KEY}',
+    'Content-Type': 'application/json',
+    'Prefer': 'return=minimal'
+}
+
 # Sample data pools
 PHISHING_DOMAINS = [
     "paypaI-verify.com",
@@ -42,6 +53,9 @@ LEGITIMATE_DOMAINS = [
     "wikipedia.org"
 ]
 
+# Page title stem per domain (e.g. "paypaI-verify.com" -> "Paypai-verify")
+DOMAIN_TITLE = {domain: domain.split('.', 1)[0].capitalize() for domain in PHISHING_DOMAINS + LEGITIMATE_DOMAINS}
+
 THREAT_REASONS = [
     {"factor": "Lookalike domain detected", "weight": 35},
     {"factor": "VirusTotal: 8 vendors flagged malicious", "weight": 30},
@@ -57,92 +71,127 @@ THREAT_REASONS = [
 
 SIMULATION_TYPES = ["fake_login", "lookalike_domain", "urgent_email", "mixed_threat"]
 
+# Domain pools as arrays, so a whole column of domains is one rng.choice draw
+PHISHING_DOMAIN_ARRAY = np.array(PHISHING_DOMAINS)
+LEGITIMATE_DOMAIN_ARRAY = np.array(LEGITIMATE_DOMAINS)
+
+# Risk level by threat score: Safe < 31 <= Suspicious < 61 <= Dangerous < 86 <= Critical
+RISK_LEVEL_BINS = [31, 61, 86]
+RISK_LEVEL_NAMES = np.array(["Safe", "Suspicious", "Dangerous", "Critical"])
+
+# Set to an int for reproducible sample data; every draw comes from this generator
+RANDOM_SEED = None
+rng = np.random.default_rng(RANDOM_SEED)
+
+# Rows per insert request, to stay under the REST API's payload size limit
+INSERT_BATCH_SIZE = 500
+
 def generate_user_id():
     """Generate a proper UUID for user_id"""
     return str(uuid.uuid4())
 
-def generate_threat_logs(user_id, count=50):
-    """Generate realistic threat logs"""
-    threat_logs = []
+def past_timestamps(now, days, hours, minutes=0):
+    """ISO timestamps (to the microsecond, like datetime.isoformat) the given offsets before now"""
+    offsets = (days * 86400 + hours * 3600 + minutes * 60).astype('timedelta64[s]')
+    return np.datetime_as_string(now - offsets, unit='us')
+
+def generate_threat_logs(user_id, count=50, now=None):
+    """Generate realistic threat logs (each field drawn for all rows at once)"""
+    now = np.datetime64(datetime.now()) if now is None else now
     
-    for i in range(count):
-        # Random date in last 30 days
-        days_ago = random.randint(0, 30)
-        timestamp = datetime.now() - timedelta(days=days_ago, hours=random.randint(0, 23), minutes=random.randint(0, 59))
-        
-        # 70% phishing, 30% legitimate
-        is_phishing = random.random() < 0.7
-        
-        if is_phishing:
-            domain = random.choice(PHISHING_DOMAINS)
-            threat_score = random.randint(60, 100)
-            user_action = random.choice(['blocked', 'blocked', 'blocked', 'proceeded'])
-            credential_detected = random.random() < 0.6
-            num_reasons = random.randint(2, 5)
-        else:
-            domain = random.choice(LEGITIMATE_DOMAINS)
-            threat_score = random.randint(0, 40)
-            user_action = 'auto_blocked' if threat_score < 10 else 'whitelisted'
-            credential_detected = False
-            num_reasons = random.randint(0, 2)
-        
-        # Risk level
-        if threat_score >= 86:
-            risk_level = "Critical"
-        elif threat_score >= 61:
-            risk_level = "Dangerous"
-        elif threat_score >= 31:
-            risk_level = "Suspicious"
-        else:
-            risk_level = "Safe"
-        
+    # 70% phishing, 30% legitimate
+    is_phishing = rng.random(count) < 0.7
+    
+    # Random time in last 30 days
+    timestamps = past_timestamps(
+        now,
+        rng.integers(0, 31, count),
+        rng.integers(0, 24, count),
+        rng.integers(0, 60, count)
+    )
+    
+    domains = np.where(is_phishing, rng.choice(PHISHING_DOMAIN_ARRAY, count), rng.choice(LEGITIMATE_DOMAIN_ARRAY, count))
+    threat_scores = np.where(is_phishing, rng.integers(60, 101, count), rng.integers(0, 41, count))
+    risk_levels = RISK_LEVEL_NAMES[np.digitize(threat_scores, RISK_LEVEL_BINS)]
+    num_reasons = np.where(is_phishing, rng.integers(2, 6, count), rng.integers(0, 3, count))
+    # Each row's reasons in random order (argsort of random keys); it keeps the first num_reasons
+    reason_orders = rng.random((count, len(THREAT_REASONS))).argsort(axis=1)
+    
+    # Phishing: blocked 3 times out of 4; legitimate: auto-blocked below 10
+    user_actions = np.where(
+        is_phishing,
+        np.where(rng.random(count) < 0.75, 'blocked', 'proceeded'),
+        np.where(threat_scores < 10, 'auto_blocked', 'whitelisted')
+    )
+    attack_vectors = np.where(is_phishing & (rng.random(count) < 0.5), 'email', 'web')
+    credential_detected = is_phishing & (rng.random(count) < 0.6)
+    ml_confidence = np.where(is_phishing, rng.uniform(0.7, 0.99, count), rng.uniform(0.3, 0.7, count)).round(2)
+    virustotal = np.where(is_phishing, rng.integers(5, 16, count), 0)
+    abuseipdb = np.where(is_phishing, rng.integers(50, 101, count), 0)
+    external_links = np.where(is_phishing, rng.integers(5, 21, count), rng.integers(0, 6, count))
+    
+    # Back to Python types (for orjson), then one dict per row
+    columns = zip(
+        is_phishing.tolist(), timestamps.tolist(), domains.tolist(),
+        threat_scores.tolist(), risk_levels.tolist(), num_reasons.tolist(), reason_orders.tolist(), user_actions.tolist(),
+        attack_vectors.tolist(), credential_detected.tolist(), ml_confidence.tolist(),
+        virustotal.tolist(), abuseipdb.tolist(), external_links.tolist()
+    )
+    
+    threat_logs = []
+    for (phishing, timestamp, domain, threat_score, risk_level, reasons, reason_order,
+         user_action, attack_vector, credential, confidence, vt_hits, abuse_score, links) in columns:
         threat_log = {
             "user_id": user_id,
-            "timestamp": timestamp.isoformat(),
-            "url": f"https://{domain}/login" if is_phishing else f"https://{domain}",
+            "timestamp": timestamp,
+            "url": f"https://{domain}/login" if phishing else f"https://{domain}",
             "domain": domain,
-            "page_title": f"{domain.split('.')[0].capitalize()} Login" if is_phishing else f"{domain.split('.')[0].capitalize()}",
+            "page_title": f"{DOMAIN_TITLE[domain]} Login" if phishing else DOMAIN_TITLE[domain],
             "threat_score": threat_score,
             "risk_level": risk_level,
-            "threat_reasons": random.sample(THREAT_REASONS, num_reasons) if num_reasons > 0 else [],
-            "attack_vector": random.choice(['web', 'email']) if is_phishing else 'web',
+            "threat_reasons": [THREAT_REASONS[i] for i in reason_order[:reasons]],
+            "attack_vector": attack_vector,
             "user_action": user_action,
-            "ml_confidence": round(random.uniform(0.7, 0.99), 2) if is_phishing else round(random.uniform(0.3, 0.7), 2),
+            "ml_confidence": confidence,
             "threat_intel_sources": {
-                "virustotal": random.randint(5, 15) if is_phishing else 0,
-                "abuseipdb": random.randint(50, 100) if is_phishing else 0,
-                "openphish": is_phishing
+                "virustotal": vt_hits,
+                "abuseipdb": abuse_score,
+                "openphish": phishing
             },
-            "credential_detected": credential_detected,
-            "form_action_url": f"https://malicious-collector.com/steal" if credential_detected else None,
-            "external_links_count": random.randint(5, 20) if is_phishing else random.randint(0, 5)
+            "credential_detected": credential,
+            "form_action_url": f"https://malicious-collector.com/steal" if credential else None,
+            "external_links_count": links
         }
         
         threat_logs.append(threat_log)
     
     return threat_logs
 
-def generate_simulation_results(user_id, count=15):
-    """Generate training simulation results"""
-    simulations = []
+def generate_simulation_results(user_id, count=15, now=None):
+    """Generate training simulation results (each field drawn for all rows at once)"""
+    now = np.datetime64(datetime.now()) if now is None else now
+    timestamps = past_timestamps(now, rng.integers(0, 31, count), rng.integers(0, 24, count)).tolist()
     
-    # 80% success rate
-    for i in range(count):
-        days_ago = random.randint(0, 30)
-        timestamp = datetime.now() - timedelta(days=days_ago, hours=random.randint(0, 23))
-        
-        correct = random.random() < 0.8
-        clicked = not correct if random.random() < 0.9 else correct
-        
+    # 80% success rate; 90% of the time the click matches the outcome
+    correct = rng.random(count) < 0.8
+    clicked = np.where(rng.random(count) < 0.9, ~correct, correct)
+    
+    simulation_types = rng.integers(0, len(SIMULATION_TYPES), count).tolist()
+    simulation_ids = rng.integers(1000, 10000, count).tolist()
+    decision_times = rng.integers(3, 46, count).tolist()
+    scores_shown = rng.integers(65, 96, count).tolist()
+    
+    simulations = []
+    for i, (is_correct, has_clicked) in enumerate(zip(correct.tolist(), clicked.tolist())):
         simulation = {
             "user_id": user_id,
-            "simulation_type": random.choice(SIMULATION_TYPES),
-            "simulation_url": f"https://simulation-{random.randint(1000, 9999)}.phishguard.test",
-            "clicked": clicked,
-            "time_to_decision": random.randint(3, 45),
-            "correct_identification": correct,
-            "threat_score_shown": random.randint(65, 95),
-            "completed_at": timestamp.isoformat()
+            "simulation_type": SIMULATION_TYPES[simulation_types[i]],
+            "simulation_url": f"https://simulation-{simulation_ids[i]}.phishguard.test",
+            "clicked": has_clicked,
+            "time_to_decision": decision_times[i],
+            "correct_identification": is_correct,
+            "threat_score_shown": scores_shown[i],
+            "completed_at": timestamps[i]
         }
         
         simulations.append(simulation)
@@ -170,7 +219,7 @@ def generate_achievement_badges(user_id):
     ]
     
     # Randomly add more badges
-    if random.random() < 0.5:
+    if rng.random() < 0.5:
         badges.append({
             "user_id": user_id,
             "badge_name": "guardian_angel",
@@ -186,15 +235,43 @@ def generate_community_reports():
     for domain in PHISHING_DOMAINS[:7]:  # Use subset
         report = {
             "domain": domain,
-            "threat_score": random.randint(70, 95),
-            "report_count": random.randint(50, 500),
-            "avg_threat_score": round(random.uniform(75.0, 95.0), 2),
-            "confidence_level": random.choice(['medium', 'high', 'verified'])
+            "threat_score": int(rng.integers(70, 96)),
+            "report_count": int(rng.integers(50, 501)),
+            "avg_threat_score": round(float(rng.uniform(75.0, 95.0)), 2),
+            "confidence_level": str(rng.choice(['medium', 'high', 'verified']))
         }
         reports.append(report)
     
     return reports
 
+def insert_rows(table, rows):
+    """Insert rows into a table, returning how many were inserted"""
+    response = requests.post(
+        f"{REST_URL}/{table}",
+        data=orjson.dumps(rows),
+        headers=REST_HEADERS,
+        timeout=30
+    )
+    response.raise_for_status()
+    return len(rows)
+
+async def insert_tables(tables):
+    """Insert every table's rows at once, in worker threads (wall time is the slowest insert)"""
+    # Split each table into INSERT_BATCH_SIZE-row chunks and send them all concurrently
+    batches = [
+        (table, rows[start:start + INSERT_BATCH_SIZE])
+        for table, rows in tables.items()
+        for start in range(0, len(rows), INSERT_BATCH_SIZE)
+    ]
+    counts = await asyncio.gather(*(
+        asyncio.to_thread(insert_rows, table, rows) for table, rows in batches
+    ))
+    
+    inserted = dict.fromkeys(tables, 0)
+    for (table, _), count in zip(batches, counts):
+        inserted[table] += count
+    return inserted
+
 def seed_database():
     """Seed the database with sample data"""
     print("🌱 Starting database seeding...")
@@ -222,29 +299,33 @@ def seed_database():
     except Exception as e:
         print(f"⚠️  User account creation skipped (may already exist): {e}")
     
-    # Insert threat logs
+    # One clock read for every generated timestamp
+    now = np.datetime64(datetime.now())
+    
     print("📊 Generating threat logs...")
-    threat_logs = generate_threat_logs(user_id, count=50)
-    result = supabase.table('threat_logs').insert(threat_logs).execute()
-    print(f"✅ Inserted {len(result.data)} threat logs")
+    threat_logs = generate_threat_logs(user_id, count=50, now=now)
     
-    # Insert simulation results
     print("🎯 Generating simulation results...")
-    simulations = generate_simulation_results(user_id, count=15)
-    result = supabase.table('simulation_results').insert(simulations).execute()
-    print(f"✅ Inserted {len(result.data)} simulation results")
+    simulations = generate_simulation_results(user_id, count=15, now=now)
     
-    # Insert badges
     print("🏆 Generating achievement badges...")
     badges = generate_achievement_badges(user_id)
-    result = supabase.table('achievement_badges').insert(badges).execute()
-    print(f"✅ Inserted {len(result.data)} badges")
     
-    # Insert community reports
     print("🌐 Generating community reports...")
     reports = generate_community_reports()
-    result = supabase.table('community_reports').insert(reports).execute()
-    print(f"✅ Inserted {len(result.data)} community reports")
+    
+    # The four tables are independent: insert them concurrently
+    print("📤 Inserting sample data...")
+    inserted = asyncio.run(insert_tables({
+        'threat_logs': threat_logs,
+        'simulation_results': simulations,
+        'achievement_badges': badges,
+        'community_reports': reports
+    }))
+    print(f"✅ Inserted {inserted['threat_logs']} threat logs")
+    print(f"✅ Inserted {inserted['simulation_results']} simulation results")
+    print(f"✅ Inserted {inserted['achievement_badges']} badges")
+    print(f"✅ Inserted {inserted['community_reports']} community reports")
     
     print("\n🎉 Database seeding completed!")
     print(f"🔑 Save this user ID for dashboard testing: {user_id}")
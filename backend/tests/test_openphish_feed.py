@@ -0,0 +1,70 @@
+"""
+OpenPhish feed ingestion: sync and async downloads must hash entries alike
+"""
+import asyncio
+
+import pytest
+
+import threatintel
+from threatintel import ThreatIntelligence
+
+FEED = b"https://evil.example.com\nhttp://bad.test/login/\n\nhttps://x.test:443/a\n"
+FEED_URLS = ["https://evil.example.com", "http://bad.test/login/", "https://x.test:443/a"]
+
+
+class _FakeResponse:
+    """Just enough of a requests/aiohttp response for the feed download"""
+    
+    status = status_code = 200
+    charset = encoding = 'utf-8'
+    headers = {'ETag': '"v1"'}
+    
+    def __init__(self):
+        self.content = self._lines()
+    
+    async def _lines(self):
+        for line in FEED.splitlines(keepends=True):
+            yield line
+    
+    def iter_lines(self, decode_unicode=False):
+        return iter(FEED.decode().splitlines())
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+
+class _FakeSession:
+    def get(self, *args, **kwargs):
+        return _FakeResponse()
+
+
+def _assert_matches_own_entries(intel: ThreatIntelligence):
+    for url in FEED_URLS:
+        assert intel.is_known_phishing(url), url
+        assert intel._openphish_result(url)['is_phishing'], url
+    assert not intel.is_known_phishing("https://example.org/")
+
+
+def test_sync_feed_matches_own_entries():
+    intel = ThreatIntelligence()
+    intel.session = _FakeSession()
+    intel._update_openphish_cache(force=True)
+    _assert_matches_own_entries(intel)
+
+
+def test_async_feed_matches_own_entries():
+    if not threatintel.AIOHTTP_AVAILABLE:
+        pytest.skip("aiohttp not installed")
+    intel = ThreatIntelligence()
+    intel._get_aio_session = _FakeSession
+    asyncio.run(intel._update_openphish_cache_async())
+    _assert_matches_own_entries(intel)
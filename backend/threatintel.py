@@ -2,22 +2,71 @@
 Threat Intelligence Integration
 Integrates VirusTotal, AbuseIPDB, and OpenPhish feeds
 """
+import asyncio
+import base64
+import ipaddress
+import socket
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
 import time
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
-from collections import deque
+from typing import Dict, Any, Optional, Iterable, Union
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import logging
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit
+import numpy as np
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
 
 from config import get_settings
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# (minimum value, score added, counts as a hit, reason template) per provider,
+# strictest first; the first rule a provider's value meets applies
+VIRUSTOTAL_RULES = (
+    (5, 35, True, 'VirusTotal: {} vendors flagged as malicious'),
+    (2, 20, False, 'VirusTotal: {} vendors flagged (suspicious)')
+)
+ABUSEIPDB_RULES = (
+    (75, 25, True, 'AbuseIPDB: {}% abuse confidence'),
+    (50, 15, False, 'AbuseIPDB: Moderate risk ({}%)')
+)
+
+# Port suffix dropped from a feed/lookup URL when it is its scheme's default
+DEFAULT_PORT_SUFFIXES = {'http': ':80', 'https': ':443'}
+
+# How long a resolved host -> IP answer is reused (DNS TTLs vary; keep it short)
+DNS_CACHE_TTL = 300
+
+
+@lru_cache(maxsize=4096)
+def _resolve_host(host: str, ttl_bucket: int) -> Optional[str]:
+    """IPv4 address of host, or None (ttl_bucket ages entries out of the cache)"""
+    try:
+        return socket.gethostbyname(host)
+    except OSError:
+        return None
+
+
+def resolve_ip(host: str) -> Optional[str]:
+    """host itself if it is an IP literal, else its resolved IPv4 address (None if unresolvable)"""
+    try:
+        return str(ipaddress.ip_address(host))
+    except ValueError:
+        return _resolve_host(host, int(time.monotonic() // DNS_CACHE_TTL))
+
 
 class RateLimiter:
-    """Simple rate limiter for API calls"""
+    """Token-bucket rate limiter for API calls (O(1) time and memory per call)"""
     
     def __init__(self, max_calls: int, time_window: int):
         """
@@ -27,31 +76,80 @@ class RateLimiter:
         """
         self.max_calls = max_calls
         self.time_window = time_window
-        self.calls = deque()
+        
+        # Bucket starts full and refills max_calls tokens per time_window
+        self.capacity = max_calls
+        self.refill_per_sec = max_calls / time_window
+        self.tokens = float(max_calls)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _refill(self):
+        """Add the tokens earned since the last refill (caller holds the lock)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.refill_per_sec)
+        self.last = now
     
     def can_call(self) -> bool:
         """Check if a call can be made"""
-        now = time.time()
-        
-        # Remove old calls outside time window
-        while self.calls and self.calls[0] < now - self.time_window:
-            self.calls.popleft()
-        
-        # Check if under limit
-        return len(self.calls) < self.max_calls
+        with self.lock:
+            self._refill()
+            return self.tokens >= 1
     
     def add_call(self):
         """Record a new call"""
-        self.calls.append(time.time())
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
     
     def wait_time(self) -> float:
         """Get time to wait before next call (seconds)"""
-        if self.can_call():
-            return 0.0
-        
-        oldest_call = self.calls[0]
-        wait = (oldest_call + self.time_window) - time.time()
-        return max(0.0, wait)
+        with self.lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.refill_per_sec)
+
+
+class QuotaLimiter:
+    """Daily quota for API calls, reset at UTC midnight (calendar day, not a rolling 24h)"""
+    
+    def __init__(self, max_calls: int):
+        """
+        Args:
+            max_calls: Maximum number of calls per UTC day
+        """
+        self.max_calls = max_calls
+        self.count = 0
+        self.window_start = datetime.now(timezone.utc).date()
+        self.lock = threading.Lock()
+    
+    def _roll_window(self) -> datetime:
+        """Start a fresh quota if the UTC day changed (caller holds the lock)"""
+        now = datetime.now(timezone.utc)
+        if now.date() != self.window_start:
+            self.window_start = now.date()
+            self.count = 0
+        return now
+    
+    def can_call(self) -> bool:
+        """Check if a call can be made"""
+        with self.lock:
+            self._roll_window()
+            return self.count < self.max_calls
+    
+    def add_call(self):
+        """Record a new call"""
+        with self.lock:
+            self._roll_window()
+            self.count += 1
+    
+    def wait_time(self) -> float:
+        """Get time to wait before next call (seconds)"""
+        with self.lock:
+            now = self._roll_window()
+            if self.count < self.max_calls:
+                return 0.0
+            next_window = datetime.combine(self.window_start + timedelta(days=1), datetime.min.time(), timezone.utc)
+            return (next_window - now).total_seconds()
 
 
 class ThreatIntelligence:
@@ -64,15 +162,61 @@ class ThreatIntelligence:
         
         # Rate limiters
         self.vt_limiter = RateLimiter(settings.VIRUSTOTAL_RATE_LIMIT, 60)  # 4 per minute
-        self.abuse_limiter = RateLimiter(settings.ABUSEIPDB_RATE_LIMIT, 86400)  # 1000 per day
+        self.abuse_limiter = QuotaLimiter(settings.ABUSEIPDB_RATE_LIMIT)  # 1000 per UTC day
         
         # Cache for OpenPhish feed
-        self.openphish_cache = set()
+        # Stored as the sorted 64-bit hashes of the normalized feed URLs
+        # (8 bytes per entry, instead of a set of full URL strings)
+        self.openphish_hashes = np.empty(0, dtype=np.int64)
         self.openphish_last_update = None
         self.openphish_update_interval = 900  # 15 minutes
+        # Validators of the last downloaded feed, for conditional refreshes
+        self.openphish_etag = None
+        self.openphish_last_modified = None
+        self.openphish_lock = threading.Lock()
+        self._openphish_refresh_stop = threading.Event()
         
         # Request timeout
         self.timeout = settings.REQUEST_TIMEOUT
+        
+        # One pooled keep-alive session for every provider (saves a TCP + TLS
+        # handshake per call); idempotent requests retry on transient errors
+        self.default_headers = {
+            'Accept': 'application/json',
+            'User-Agent': f'{settings.APP_NAME}/{settings.API_VERSION}'
+        }
+        self.session = requests.Session()
+        self.session.headers.update(self.default_headers)
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            # Only connection failures are retried (nothing reached the server).
+            # A sent request is never replayed: that would spend provider quota
+            # the limiters do not see, and stall callers past self.timeout (a
+            # 429's Retry-After can be hours); read=False raises the original
+            # timeout, so the Timeout handlers below still apply
+            max_retries=Retry(
+                total=2,
+                connect=2,
+                read=False,
+                status=0,
+                backoff_factor=0.3,
+                respect_retry_after_header=False,
+                raise_on_status=False  # hand the response to the status checks below
+            )
+        ))
+        
+        # Per-provider auth headers, built once (kept off the shared session so
+        # each key only goes to its own API)
+        self.vt_headers = {'x-apikey': self.virustotal_api_key}
+        self.abuse_headers = {'Key': self.abuseipdb_api_key}
+        
+        # Worker threads for the provider lookups check_all fans out
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='threatintel')
+        
+        # aiohttp session for the async lookups, created on first use inside
+        # the event loop that will own it
+        self._aio_session = None
     
     def check_all(self, url: str) -> Dict[str, Any]:
         """
@@ -85,82 +229,132 @@ class ThreatIntelligence:
                 'abuseipdb': {...},
                 'openphish': {...},
                 'hits': int,
-                'reasons': List[str]
+                'reasons': List[str],
+                'reason_sources': List[str] (feed behind each reason)
             }
         """
+        # One timestamp for every provider result of this check
+        timestamp = datetime.now().isoformat()
+        
+        # Start the API lookups in parallel; total latency is the slowest provider
+        vt_future = self.executor.submit(self.check_virustotal, url, timestamp) if self.virustotal_api_key else None
+        abuse_future = self.executor.submit(self.check_abuseipdb, url, timestamp) if self.abuseipdb_api_key else None
+        
+        # Check OpenPhish meanwhile (local feed lookup, no API key)
+        openphish_result = self.check_openphish(url)
+        
+        return self._combine_results(
+            openphish_result,
+            vt_future.result() if vt_future else None,
+            abuse_future.result() if abuse_future else None
+        )
+    
+    async def check_all_async(self, url: str) -> Dict[str, Any]:
+        """check_all on the event loop: every provider lookup in flight at once over aiohttp"""
+        if not AIOHTTP_AVAILABLE:
+            return await asyncio.to_thread(self.check_all, url)
+        
+        timestamp = datetime.now().isoformat()
+        lookups = [self.check_openphish_async(url)]
+        if self.virustotal_api_key:
+            lookups.append(self.check_virustotal_async(url, timestamp))
+        if self.abuseipdb_api_key:
+            lookups.append(self.check_abuseipdb_async(url, timestamp))
+        
+        lookup_results = [
+            {'success': False, 'error': str(result)} if isinstance(result, Exception) else result
+            for result in await asyncio.gather(*lookups, return_exceptions=True)
+        ]
+        openphish_result = lookup_results.pop(0)
+        vt_result = lookup_results.pop(0) if self.virustotal_api_key else None
+        abuse_result = lookup_results.pop(0) if self.abuseipdb_api_key else None
+        
+        return self._combine_results(openphish_result, vt_result, abuse_result)
+    
+    def _combine_results(
+        self,
+        openphish_result: Dict[str, Any],
+        vt_result: Optional[Dict[str, Any]],
+        abuse_result: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Score the provider results (None = provider not configured) into check_all's shape"""
         results = {
             'threat_intel_score': 0,
             'virustotal': {},
             'abuseipdb': {},
             'openphish': {},
             'hits': 0,
-            'reasons': []
+            'reasons': [],
+            'reason_sources': []
         }
         
-        # Check OpenPhish first (fastest, no API key)
-        openphish_result = self.check_openphish(url)
+        # OpenPhish
         results['openphish'] = openphish_result
         if openphish_result.get('is_phishing'):
             results['hits'] += 1
             results['threat_intel_score'] += 40  # Critical weight
             results['reasons'].append('Listed in OpenPhish feed (confirmed phishing)')
+            results['reason_sources'].append('openphish')
         
-        # Check VirusTotal
-        if self.virustotal_api_key:
-            vt_result = self.check_virustotal(url)
+        # VirusTotal
+        if vt_result is not None:
             results['virustotal'] = vt_result
             
             if vt_result.get('success'):
-                detections = vt_result.get('detections', 0)
-                if detections >= 5:
-                    results['hits'] += 1
-                    results['threat_intel_score'] += 35
-                    results['reasons'].append(f'VirusTotal: {detections} vendors flagged as malicious')
-                elif detections >= 2:
-                    results['threat_intel_score'] += 20
-                    results['reasons'].append(f'VirusTotal: {detections} vendors flagged (suspicious)')
+                self._apply_rules(results, VIRUSTOTAL_RULES, vt_result.get('detections', 0), 'virustotal')
         
-        # Check AbuseIPDB
-        if self.abuseipdb_api_key:
-            abuse_result = self.check_abuseipdb(url)
+        # AbuseIPDB
+        if abuse_result is not None:
             results['abuseipdb'] = abuse_result
             
             if abuse_result.get('success'):
-                abuse_score = abuse_result.get('abuse_confidence_score', 0)
-                if abuse_score >= 75:
-                    results['hits'] += 1
-                    results['threat_intel_score'] += 25
-                    results['reasons'].append(f'AbuseIPDB: {abuse_score}% abuse confidence')
-                elif abuse_score >= 50:
-                    results['threat_intel_score'] += 15
-                    results['reasons'].append(f'AbuseIPDB: Moderate risk ({abuse_score}%)')
+                self._apply_rules(results, ABUSEIPDB_RULES, abuse_result.get('abuse_confidence_score', 0), 'abuseipdb')
         
         # Normalize score to 0-100
         results['threat_intel_score'] = min(results['threat_intel_score'], 100)
         
         return results
     
-    def check_virustotal(self, url: str) -> Dict[str, Any]:
+    def _apply_rules(self, results: Dict[str, Any], rules: tuple, value: float, source: str):
+        """Add the first of a provider's rules that value meets to results"""
+        for minimum, score, is_hit, template in rules:
+            if value >= minimum:
+                if is_hit:
+                    results['hits'] += 1
+                results['threat_intel_score'] += score
+                results['reasons'].append(template.format(value))
+                results['reason_sources'].append(source)
+                return
+    
+    def check_virustotal(self, url: str, timestamp: Optional[str] = None) -> Dict[str, Any]:
         """Check URL against VirusTotal"""
         if not self.virustotal_api_key:
             return {'success': False, 'error': 'API key not configured'}
         
         # Check rate limit
-        if not self.vt_limiter.can_call():
-            wait_time = self.vt_limiter.wait_time()
-            logger.warning(f"VirusTotal rate limit hit, need to wait {wait_time:.1f}s")
-            return {'success': False, 'error': 'rate_limited', 'wait_time': wait_time}
+        rate_limited = self._rate_limited(self.vt_limiter, 'VirusTotal')
+        if rate_limited:
+            return rate_limited
         
         try:
-            # URL analysis endpoint
-            headers = {
-                'x-apikey': self.virustotal_api_key
-            }
+            # Already-seen URL: its last analysis comes with the URL object
+            response = self.session.get(
+                f'https://www.virustotal.com/api/v3/urls/{self._virustotal_url_id(url)}',
+                headers=self.vt_headers,
+                timeout=self.timeout
+            )
             
-            # Submit URL for analysis
-            response = requests.post(
+            self.vt_limiter.add_call()
+            
+            if response.status_code == 200:
+                return self._virustotal_result(response.json()['data']['attributes']['last_analysis_stats'], timestamp)
+            if response.status_code != 404:
+                return {'success': False, 'error': f'HTTP {response.status_code}'}
+            
+            # Unseen URL: submit it for analysis
+            response = self.session.post(
                 'https://www.virustotal.com/api/v3/urls',
-                headers=headers,
+                headers=self.vt_headers,
                 data={'url': url},
                 timeout=self.timeout
             )
@@ -172,25 +366,14 @@ class ThreatIntelligence:
                 analysis_id = data['data']['id']
                 
                 # Get analysis results
-                analysis_response = requests.get(
+                analysis_response = self.session.get(
                     f'https://www.virustotal.com/api/v3/analyses/{analysis_id}',
-                    headers=headers,
+                    headers=self.vt_headers,
                     timeout=self.timeout
                 )
                 
                 if analysis_response.status_code == 200:
-                    analysis_data = analysis_response.json()
-                    stats = analysis_data['data']['attributes']['stats']
-                    
-                    return {
-                        'success': True,
-                        'detections': stats.get('malicious', 0),
-                        'suspicious': stats.get('suspicious', 0),
-                        'harmless': stats.get('harmless', 0),
-                        'undetected': stats.get('undetected', 0),
-                        'total_vendors': sum(stats.values()),
-                        'timestamp': datetime.now().isoformat()
-                    }
+                    return self._virustotal_result(analysis_response.json()['data']['attributes']['stats'], timestamp)
             
             return {'success': False, 'error': f'HTTP {response.status_code}'}
             
@@ -201,40 +384,31 @@ class ThreatIntelligence:
             logger.error(f"VirusTotal error: {e}")
             return {'success': False, 'error': str(e)}
     
-    def check_abuseipdb(self, url: str) -> Dict[str, Any]:
+    def check_abuseipdb(self, url: str, timestamp: Optional[str] = None) -> Dict[str, Any]:
         """Check domain/IP against AbuseIPDB"""
         if not self.abuseipdb_api_key:
             return {'success': False, 'error': 'API key not configured'}
         
         # Check rate limit
-        if not self.abuse_limiter.can_call():
-            wait_time = self.abuse_limiter.wait_time()
-            logger.warning(f"AbuseIPDB rate limit hit, need to wait {wait_time:.1f}s")
-            return {'success': False, 'error': 'rate_limited', 'wait_time': wait_time}
+        rate_limited = self._rate_limited(self.abuse_limiter, 'AbuseIPDB')
+        if rate_limited:
+            return rate_limited
         
         try:
-            # Extract domain/IP
-            parsed = urlparse(url)
-            host = parsed.hostname or parsed.netloc
-            
+            host = self._url_host(url)
             if not host:
                 return {'success': False, 'error': 'Could not extract host'}
             
-            headers = {
-                'Key': self.abuseipdb_api_key,
-                'Accept': 'application/json'
-            }
+            # /check takes an IP: resolve domains here, and spend no call on ones
+            # that do not resolve
+            ip = resolve_ip(host)
+            if not ip:
+                return {'success': False, 'error': 'resolve_failed'}
             
-            params = {
-                'ipAddress': host,
-                'maxAgeInDays': 90,
-                'verbose': ''
-            }
-            
-            response = requests.get(
+            response = self.session.get(
                 'https://api.abuseipdb.com/api/v2/check',
-                headers=headers,
-                params=params,
+                headers=self.abuse_headers,
+                params=self._abuseipdb_params(ip),
                 timeout=self.timeout
             )
             
@@ -244,15 +418,7 @@ class ThreatIntelligence:
                 data = response.json()
                 
                 if data.get('data'):
-                    abuse_data = data['data']
-                    return {
-                        'success': True,
-                        'abuse_confidence_score': abuse_data.get('abuseConfidenceScore', 0),
-                        'total_reports': abuse_data.get('totalReports', 0),
-                        'is_whitelisted': abuse_data.get('isWhitelisted', False),
-                        'country': abuse_data.get('countryCode'),
-                        'timestamp': datetime.now().isoformat()
-                    }
+                    return self._abuseipdb_result(data['data'], timestamp)
             
             return {'success': False, 'error': f'HTTP {response.status_code}'}
             
@@ -269,50 +435,347 @@ class ThreatIntelligence:
             # Update cache if needed
             self._update_openphish_cache()
             
-            # Normalize URL
-            normalized_url = url.lower().strip()
-            
-            # Check if URL is in feed
-            is_phishing = normalized_url in self.openphish_cache
-            
-            return {
-                'success': True,
-                'is_phishing': is_phishing,
-                'feed_size': len(self.openphish_cache),
-                'last_updated': self.openphish_last_update.isoformat() if self.openphish_last_update else None
-            }
+            return self._openphish_result(url)
             
         except Exception as e:
             logger.error(f"OpenPhish error: {e}")
             return {'success': False, 'error': str(e)}
     
-    def _update_openphish_cache(self):
-        """Update OpenPhish feed cache"""
+    def is_known_phishing(self, url: str) -> bool:
+        """Check URL against the already-loaded OpenPhish feed (no network)"""
+        return self._in_openphish_feed(url)
+    
+    def _update_openphish_cache(self, force: bool = False):
+        """Update OpenPhish feed cache (force: even if it is not yet due)"""
         now = datetime.now()
         
-        # Check if update needed
-        if (self.openphish_last_update and 
-            (now - self.openphish_last_update).total_seconds() < self.openphish_update_interval):
+        # Check if update needed; one download at a time (concurrent callers
+        # keep using the loaded feed meanwhile)
+        if (not force and self._openphish_is_fresh(now)) or not self.openphish_lock.acquire(blocking=False):
             return
         
         try:
             logger.info("Updating OpenPhish feed...")
-            response = requests.get(
+            # Streamed (gzip-encoded when the server supports it), so the feed
+            # is hashed line by line instead of held in memory as one string
+            with self.session.get(
                 self.openphish_feed_url,
+                headers=self._openphish_validators(),
+                stream=True,
                 timeout=10
+            ) as response:
+                if response.status_code == 304:
+                    self._keep_openphish_feed(now)
+                elif response.status_code == 200:
+                    if response.encoding is None:
+                        response.encoding = 'utf-8'
+                    self._store_openphish_feed(
+                        self._feed_url_hashes(response.iter_lines(decode_unicode=True)),
+                        now,
+                        response.headers
+                    )
+                else:
+                    logger.error(f"Failed to update OpenPhish feed: HTTP {response.status_code}")
+                
+        except Exception as e:
+            logger.error(f"Error updating OpenPhish feed: {e}")
+        finally:
+            self.openphish_lock.release()
+    
+    def start_openphish_refresh(self):
+        """Load the feed now and keep it fresh from a daemon thread"""
+        # Warms the feed at startup instead of on the first request
+        self._openphish_refresh_stop.clear()
+        threading.Thread(target=self._openphish_refresh_loop, name='openphish-refresh', daemon=True).start()
+    
+    def stop_openphish_refresh(self):
+        """Stop the background feed refresh"""
+        self._openphish_refresh_stop.set()
+    
+    def _openphish_refresh_loop(self):
+        """Refresh the feed every update interval until stopped"""
+        while True:
+            self._update_openphish_cache(force=True)
+            if self._openphish_refresh_stop.wait(self.openphish_update_interval):
+                return
+    
+    def _openphish_is_fresh(self, now: datetime) -> bool:
+        """Whether the loaded feed is younger than the update interval"""
+        return bool(self.openphish_last_update and
+                    (now - self.openphish_last_update).total_seconds() < self.openphish_update_interval)
+    
+    def _openphish_validators(self) -> Dict[str, str]:
+        """Conditional-request headers, so an unchanged feed answers 304"""
+        headers = {}
+        if self.openphish_etag:
+            headers['If-None-Match'] = self.openphish_etag
+        if self.openphish_last_modified:
+            headers['If-Modified-Since'] = self.openphish_last_modified
+        return headers
+    
+    @staticmethod
+    def _feed_url_hashes(lines: Iterable[str]) -> Iterable[int]:
+        """Hash each URL of the feed (one URL per line)"""
+        # hash() is the interpreter's 64-bit SipHash, stable for the life of
+        # the process (which is all the feed lives for, so it is never persisted)
+        for line in lines:
+            if line.strip():
+                yield hash(ThreatIntelligence._normalize_feed_url(line))
+    
+    @staticmethod
+    def _normalize_feed_url(url: str) -> str:
+        """Canonical form of a URL for feed matching"""
+        # Feed entries and lookups differ in trivia (http://site.com/ vs
+        # http://site.com, :443 on https, #fragments) that must not cause a miss
+        url = url.strip().lower()
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return url
+        if not parts.netloc:
+            return url
+        netloc = parts.netloc
+        if parts.scheme in DEFAULT_PORT_SUFFIXES:
+            netloc = netloc.removesuffix(DEFAULT_PORT_SUFFIXES[parts.scheme])
+        path = parts.path.rstrip('/') or '/'
+        query = f'?{parts.query}' if parts.query else ''
+        return f'{parts.scheme}://{netloc}{path}{query}'
+    
+    def _store_openphish_feed(self, hashes: Iterable[int], now: datetime, headers):
+        """Replace the feed cache with a freshly downloaded feed"""
+        self.openphish_hashes = np.unique(np.fromiter(hashes, dtype=np.int64))
+        self.openphish_last_update = now
+        self.openphish_etag = headers.get('ETag')
+        self.openphish_last_modified = headers.get('Last-Modified')
+        logger.info(f"OpenPhish feed updated: {len(self.openphish_hashes)} URLs")
+    
+    def _keep_openphish_feed(self, now: datetime):
+        """Feed unchanged on the server (304): keep it for another interval"""
+        self.openphish_last_update = now
+        logger.info("OpenPhish feed unchanged")
+    
+    def _in_openphish_feed(self, url: str) -> bool:
+        """Binary-search the feed hashes for the normalized URL"""
+        hashes = self.openphish_hashes
+        url_hash = hash(self._normalize_feed_url(url))
+        i = hashes.searchsorted(url_hash)
+        return bool(i < len(hashes) and hashes[i] == url_hash)
+    
+    def _openphish_result(self, url: str) -> Dict[str, Any]:
+        """Look a URL up in the loaded feed"""
+        return {
+            'success': True,
+            'is_phishing': self._in_openphish_feed(url),
+            'feed_size': len(self.openphish_hashes),
+            'last_updated': self.openphish_last_update.isoformat() if self.openphish_last_update else None
+        }
+    
+    def _rate_limited(self, limiter: Union[RateLimiter, QuotaLimiter], provider: str) -> Optional[Dict[str, Any]]:
+        """The rate-limited error result if limiter allows no call right now, else None"""
+        if limiter.can_call():
+            return None
+        wait_time = limiter.wait_time()
+        logger.warning(f"{provider} rate limit hit, need to wait {wait_time:.1f}s")
+        return {'success': False, 'error': 'rate_limited', 'wait_time': wait_time}
+    
+    def _url_host(self, url: str) -> str:
+        """Domain/IP of a URL ('' if there is none)"""
+        parsed = urlparse(url)
+        return parsed.hostname or parsed.netloc
+    
+    def _abuseipdb_params(self, ip: str) -> Dict[str, Any]:
+        """AbuseIPDB check query for an IP"""
+        return {
+            'ipAddress': ip,
+            'maxAgeInDays': 90,
+            'verbose': ''
+        }
+    
+    @staticmethod
+    def _virustotal_url_id(url: str) -> str:
+        """VirusTotal URL identifier: unpadded base64url of the URL"""
+        return base64.urlsafe_b64encode(url.encode()).decode().rstrip('=')
+    
+    def _virustotal_result(self, stats: Dict[str, int], timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """Summarize VirusTotal per-verdict vendor counts"""
+        return {
+            'success': True,
+            'detections': stats.get('malicious', 0),
+            'suspicious': stats.get('suspicious', 0),
+            'harmless': stats.get('harmless', 0),
+            'undetected': stats.get('undetected', 0),
+            'total_vendors': sum(stats.values()),
+            'timestamp': timestamp or datetime.now().isoformat()
+        }
+    
+    def _abuseipdb_result(self, abuse_data: Dict[str, Any], timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """Summarize an AbuseIPDB check response"""
+        return {
+            'success': True,
+            'abuse_confidence_score': abuse_data.get('abuseConfidenceScore', 0),
+            'total_reports': abuse_data.get('totalReports', 0),
+            'is_whitelisted': abuse_data.get('isWhitelisted', False),
+            'country': abuse_data.get('countryCode'),
+            'timestamp': timestamp or datetime.now().isoformat()
+        }
+    
+    # Async variants (aiohttp), for callers already on an event loop
+    
+    def _get_aio_session(self) -> "aiohttp.ClientSession":
+        """Pooled aiohttp session, created lazily on the running loop"""
+        if self._aio_session is None or self._aio_session.closed:
+            self._aio_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.default_headers
             )
+        return self._aio_session
+    
+    async def close_async(self):
+        """Close the aiohttp session (on application shutdown)"""
+        if self._aio_session is not None and not self._aio_session.closed:
+            await self._aio_session.close()
+        self._aio_session = None
+    
+    async def check_virustotal_async(self, url: str, timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """Async check_virustotal"""
+        if not self.virustotal_api_key:
+            return {'success': False, 'error': 'API key not configured'}
+        
+        # Check rate limit
+        rate_limited = self._rate_limited(self.vt_limiter, 'VirusTotal')
+        if rate_limited:
+            return rate_limited
+        
+        session = self._get_aio_session()
+        try:
+            # Already-seen URL: its last analysis comes with the URL object
+            async with session.get(
+                f'https://www.virustotal.com/api/v3/urls/{self._virustotal_url_id(url)}',
+                headers=self.vt_headers
+            ) as response:
+                self.vt_limiter.add_call()
+                if response.status == 200:
+                    data = await response.json()
+                    return self._virustotal_result(data['data']['attributes']['last_analysis_stats'], timestamp)
+                if response.status != 404:
+                    return {'success': False, 'error': f'HTTP {response.status}'}
             
-            if response.status_code == 200:
-                # Parse feed (one URL per line)
-                urls = set(line.strip().lower() for line in response.text.split('\n') if line.strip())
-                self.openphish_cache = urls
-                self.openphish_last_update = now
-                logger.info(f"OpenPhish feed updated: {len(urls)} URLs")
-            else:
-                logger.error(f"Failed to update OpenPhish feed: HTTP {response.status_code}")
+            # Unseen URL: submit it for analysis
+            async with session.post(
+                'https://www.virustotal.com/api/v3/urls',
+                headers=self.vt_headers,
+                data={'url': url}
+            ) as response:
+                self.vt_limiter.add_call()
+                if response.status != 200:
+                    return {'success': False, 'error': f'HTTP {response.status}'}
+                data = await response.json()
+            
+            # Get analysis results
+            analysis_id = data['data']['id']
+            async with session.get(
+                f'https://www.virustotal.com/api/v3/analyses/{analysis_id}',
+                headers=self.vt_headers
+            ) as analysis_response:
+                if analysis_response.status == 200:
+                    analysis_data = await analysis_response.json()
+                    return self._virustotal_result(analysis_data['data']['attributes']['stats'], timestamp)
+            
+            return {'success': False, 'error': f'HTTP {response.status}'}
+            
+        except asyncio.TimeoutError:
+            logger.error("VirusTotal request timeout")
+            return {'success': False, 'error': 'timeout'}
+        except Exception as e:
+            logger.error(f"VirusTotal error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    async def check_abuseipdb_async(self, url: str, timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """Async check_abuseipdb"""
+        if not self.abuseipdb_api_key:
+            return {'success': False, 'error': 'API key not configured'}
+        
+        # Check rate limit
+        rate_limited = self._rate_limited(self.abuse_limiter, 'AbuseIPDB')
+        if rate_limited:
+            return rate_limited
+        
+        try:
+            host = self._url_host(url)
+            if not host:
+                return {'success': False, 'error': 'Could not extract host'}
+            
+            # /check takes an IP (see check_abuseipdb); resolve off the event loop
+            ip = await asyncio.to_thread(resolve_ip, host)
+            if not ip:
+                return {'success': False, 'error': 'resolve_failed'}
+            
+            async with self._get_aio_session().get(
+                'https://api.abuseipdb.com/api/v2/check',
+                headers=self.abuse_headers,
+                params=self._abuseipdb_params(ip)
+            ) as response:
+                self.abuse_limiter.add_call()
+                
+                if response.status == 200:
+                    data = await response.json()
+                    
+                    if data.get('data'):
+                        return self._abuseipdb_result(data['data'], timestamp)
+            
+            return {'success': False, 'error': f'HTTP {response.status}'}
+            
+        except asyncio.TimeoutError:
+            logger.error("AbuseIPDB request timeout")
+            return {'success': False, 'error': 'timeout'}
+        except Exception as e:
+            logger.error(f"AbuseIPDB error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    async def check_openphish_async(self, url: str) -> Dict[str, Any]:
+        """Async check_openphish"""
+        try:
+            # Update cache if needed
+            await self._update_openphish_cache_async()
+            
+            return self._openphish_result(url)
+            
+        except Exception as e:
+            logger.error(f"OpenPhish error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    async def _update_openphish_cache_async(self):
+        """Async _update_openphish_cache"""
+        now = datetime.now()
+        
+        # Check if update needed; one download at a time (concurrent callers
+        # keep using the loaded feed meanwhile)
+        if self._openphish_is_fresh(now) or not self.openphish_lock.acquire(blocking=False):
+            return
+        
+        try:
+            logger.info("Updating OpenPhish feed...")
+            async with self._get_aio_session().get(
+                self.openphish_feed_url,
+                headers=self._openphish_validators(),
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                if response.status == 304:
+                    self._keep_openphish_feed(now)
+                elif response.status == 200:
+                    # Read line by line as it arrives; hashed by the same
+                    # routine as the sync download so lookups match either way
+                    encoding = response.charset or 'utf-8'
+                    lines = [line.decode(encoding, errors='replace') async for line in response.content]
+                    self._store_openphish_feed(self._feed_url_hashes(lines), now, response.headers)
+                else:
+                    logger.error(f"Failed to update OpenPhish feed: HTTP {response.status}")
                 
         except Exception as e:
             logger.error(f"Error updating OpenPhish feed: {e}")
+        finally:
+            self.openphish_lock.release()
 
 
 # Global instance
@@ -2,12 +2,25 @@
 Caching Layer
 Redis-based caching with TTL management
 """
-import json
 import hashlib
-from typing import Optional, Any
-from datetime import datetime, timedelta
+import queue
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from typing import Optional, Any, Union, Dict, List, Tuple
 import logging
 
+import orjson
+
+try:
+    # Fast non-cryptographic hash for cache keys
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
 try:
     import redis
     REDIS_AVAILABLE = True
@@ -20,14 +33,47 @@ from config import get_settings
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Entry bound for the in-memory fallback (least recently used entries go first)
+MEMORY_CACHE_MAX_ENTRIES = 10000
+
+# Keys unlinked per round-trip when clearing the namespace
+CLEAR_BATCH_SIZE = 1000
+
+# Cached values may carry NumPy scalars/arrays (e.g. model outputs)
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+def _dumps(value: Any) -> bytes:
+    """Serialize a cache value to JSON bytes"""
+    return orjson.dumps(value, option=ORJSON_OPTIONS)
+
+
+@lru_cache(maxsize=16384)
+def _hash_text(text: str) -> str:
+    """Generate hash of text (16 hex chars)"""
+    # Keys only need to be stable and well spread, not cryptographic
+    if XXHASH_AVAILABLE:
+        return xxhash.xxh3_64_hexdigest(text.encode())
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+@lru_cache(maxsize=16384)
+def _url_key(url: str) -> str:
+    """Cache key for a URL's analysis"""
+    return f"url_analysis:{_hash_text(url.lower().strip())}"
+
 
 class Cache:
     """Thread-safe caching layer with TTL support"""
     
     def __init__(self):
         self.redis_client = None
-        self.memory_cache = {}  # Fallback in-memory cache
+        self.memory_cache = OrderedDict()  # Fallback in-memory LRU cache
+        self.memory_lock = threading.Lock()  # Guards memory_cache across request threads
         self.use_redis = REDIS_AVAILABLE
+        # Redis keys live under this prefix, so instances sharing a Redis
+        # DB (or other apps in it) do not collide
+        self.prefix = f"{settings.CACHE_NAMESPACE}:" if settings.CACHE_NAMESPACE else ""
         
         if REDIS_AVAILABLE:
             try:
@@ -36,7 +82,7 @@ class Cache:
                     port=settings.REDIS_PORT,
                     db=settings.REDIS_DB,
                     password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
-                    decode_responses=True,
+                    decode_responses=False,  # values stay JSON bytes for orjson / responses
                     socket_timeout=2,
                     socket_connect_timeout=2
                 )
@@ -52,22 +98,39 @@ class Cache:
         """Get value from cache"""
         try:
             if self.use_redis and self.redis_client:
-                value = self.redis_client.get(key)
+                value = self.redis_client.get(self.prefix + key)
                 if value:
-                    return json.loads(value)
+                    return orjson.loads(value)
             else:
                 # In-memory cache with expiry check
-                if key in self.memory_cache:
-                    data, expires_at = self.memory_cache[key]
-                    if expires_at and datetime.now() > expires_at:
-                        del self.memory_cache[key]
-                        return None
-                    return data
+                with self.memory_lock:
+                    entry = self.memory_cache.get(key)
+                    if entry is not None:
+                        data, expires_at = entry
+                        if expires_at and time.monotonic() > expires_at:
+                            del self.memory_cache[key]
+                            return None
+                        self.memory_cache.move_to_end(key)
+                        return data
         except Exception as e:
             logger.error(f"Cache get error: {e}")
         
         return None
     
+    def get_raw(self, key: str) -> Optional[Union[str, bytes]]:
+        """Get value from cache as serialized JSON, without decoding it"""
+        try:
+            if self.use_redis and self.redis_client:
+                return self.redis_client.get(self.prefix + key)
+            else:
+                data = self.get(key)
+                if data is not None:
+                    return _dumps(data)
+        except Exception as e:
+            logger.error(f"Cache get_raw error: {e}")
+        
+        return None
+    
     def set(self, key: str, value: Any, ttl: int = None):
         """
         Set value in cache with optional TTL
@@ -79,35 +142,85 @@ class Cache:
         """
         try:
             if self.use_redis and self.redis_client:
-                serialized = json.dumps(value)
+                serialized = _dumps(value)
                 if ttl:
-                    self.redis_client.setex(key, ttl, serialized)
+                    self.redis_client.setex(self.prefix + key, ttl, serialized)
                 else:
-                    self.redis_client.set(key, serialized)
+                    self.redis_client.set(self.prefix + key, serialized)
             else:
-                # In-memory cache
-                expires_at = None
-                if ttl:
-                    expires_at = datetime.now() + timedelta(seconds=ttl)
-                self.memory_cache[key] = (value, expires_at)
-                
-                # Limit memory cache size
-                if len(self.memory_cache) > 10000:
-                    # Remove 10% oldest entries
-                    to_remove = int(len(self.memory_cache) * 0.1)
-                    for old_key in list(self.memory_cache.keys())[:to_remove]:
-                        del self.memory_cache[old_key]
+                # In-memory cache, expiring at a monotonic-clock deadline
+                expires_at = time.monotonic() + ttl if ttl else None
+                with self.memory_lock:
+                    self.memory_cache[key] = (value, expires_at)
+                    self.memory_cache.move_to_end(key)
+                    
+                    # Limit memory cache size: evict least recently used entries
+                    while len(self.memory_cache) > MEMORY_CACHE_MAX_ENTRIES:
+                        self.memory_cache.popitem(last=False)
         
         except Exception as e:
             logger.error(f"Cache set error: {e}")
     
+    def set_raw(self, key: str, raw: bytes, ttl: int = None):
+        """Set an already-serialized JSON value (as get_raw returns it), with TTL as in set()"""
+        try:
+            if self.use_redis and self.redis_client:
+                if ttl:
+                    self.redis_client.setex(self.prefix + key, ttl, raw)
+                else:
+                    self.redis_client.set(self.prefix + key, raw)
+            else:
+                # The in-memory cache holds decoded values
+                self.set(key, orjson.loads(raw), ttl)
+        except Exception as e:
+            logger.error(f"Cache set_raw error: {e}")
+    
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get many values in one round-trip (None for each missing key)"""
+        if not keys:
+            return []
+        try:
+            if self.use_redis and self.redis_client:
+                return [orjson.loads(value) if value else None for value in self.redis_client.mget([self.prefix + key for key in keys])]
+        except Exception as e:
+            logger.error(f"Cache mget error: {e}")
+            return [None] * len(keys)
+        
+        return [self.get(key) for key in keys]
+    
+    def mset(self, items: List[Tuple[str, Any, Optional[int]]]):
+        """
+        Set many values in one round-trip
+        
+        Args:
+            items: (key, value, ttl) triples, with ttl as in set()
+        """
+        try:
+            if self.use_redis and self.redis_client:
+                with self.redis_client.pipeline(transaction=False) as pipe:
+                    for key, value, ttl in items:
+                        serialized = _dumps(value)
+                        if ttl:
+                            pipe.setex(self.prefix + key, ttl, serialized)
+                        else:
+                            pipe.set(self.prefix + key, serialized)
+                    pipe.execute()
+                return
+        except Exception as e:
+            logger.error(f"Cache mset error: {e}")
+            return
+        
+        for key, value, ttl in items:
+            self.set(key, value, ttl)
+    
     def delete(self, key: str):
         """Delete key from cache"""
         try:
             if self.use_redis and self.redis_client:
-                self.redis_client.delete(key)
+                self.redis_client.delete(self.prefix + key)
             else:
-                self.memory_cache.pop(key, None)
+                with self.memory_lock:
+                    self.memory_cache.pop(key, None)
         except Exception as e:
             logger.error(f"Cache delete error: {e}")
     
@@ -115,26 +228,33 @@ class Cache:
         """Check if key exists in cache"""
         try:
             if self.use_redis and self.redis_client:
-                return bool(self.redis_client.exists(key))
+                return bool(self.redis_client.exists(self.prefix + key))
             else:
-                if key in self.memory_cache:
-                    _, expires_at = self.memory_cache[key]
-                    if expires_at and datetime.now() > expires_at:
+                with self.memory_lock:
+                    entry = self.memory_cache.get(key)
+                    if entry is None:
+                        return False
+                    _, expires_at = entry
+                    if expires_at and time.monotonic() > expires_at:
                         del self.memory_cache[key]
                         return False
                     return True
-                return False
         except Exception as e:
             logger.error(f"Cache exists error: {e}")
             return False
     
     def clear(self):
-        """Clear entire cache"""
+        """Clear entire cache (only this namespace's keys in Redis)"""
         try:
             if self.use_redis and self.redis_client:
-                self.redis_client.flushdb()
+                # SCAN + UNLINK in batches: unlike FLUSHDB this leaves other keys
+                # alone, and neither blocks Redis on a large DB
+                keys = self.redis_client.scan_iter(match=f"{self.prefix}*", count=CLEAR_BATCH_SIZE)
+                while batch := list(islice(keys, CLEAR_BATCH_SIZE)):
+                    self.redis_client.unlink(*batch)
             else:
-                self.memory_cache.clear()
+                with self.memory_lock:
+                    self.memory_cache.clear()
             logger.info("Cache cleared")
         except Exception as e:
             logger.error(f"Cache clear error: {e}")
@@ -173,12 +293,26 @@ class ThreatCache:
         self.ttl_positive = settings.CACHE_TTL_POSITIVE  # 7 days
         self.ttl_negative = settings.CACHE_TTL_NEGATIVE  # 24 hours
         self.ttl_critical = settings.CACHE_TTL_CRITICAL  # Permanent (-1)
+        
+        # Writes handed off by queue_url_analysis, drained by a writer thread
+        self.write_queue = queue.SimpleQueue()
+        self.writer_thread = None
+        self.writer_lock = threading.Lock()
     
     def get_url_analysis(self, url: str) -> Optional[dict]:
         """Get cached URL analysis result"""
         key = self._make_url_key(url)
         return self.cache.get(key)
     
+    def get_url_analysis_bytes(self, url: str) -> Optional[Union[str, bytes]]:
+        """Get cached URL analysis result as ready-to-send JSON"""
+        key = self._make_url_key(url)
+        return self.cache.get_raw(key)
+    
+    def get_url_analyses(self, urls: List[str]) -> Dict[str, Optional[dict]]:
+        """Get cached analysis results for many URLs in one cache round-trip"""
+        return dict(zip(urls, self.cache.mget([self._make_url_key(url) for url in urls])))
+    
     def set_url_analysis(self, url: str, result: dict):
         """
         Cache URL analysis result with appropriate TTL
@@ -188,8 +322,57 @@ class ThreatCache:
         - Negative hits (safe): 24 hours
         - Critical hits (high threat): Permanent until manual review
         """
-        key = self._make_url_key(url)
-        
+        self.cache.set(self._make_url_key(url), result, self._url_analysis_ttl(url, result))
+    
+    def queue_url_analysis(self, url: str, result: dict):
+        """set_url_analysis from a background thread: returns once the write is queued"""
+        # Serialization and the Redis round-trip happen on the writer thread,
+        # off the request path; the entry shows up a moment later
+        if not self.cache.use_redis:
+            self.set_url_analysis(url, result)
+            return
+        self._start_writer()
+        self.write_queue.put((self._make_url_key(url), result, self._url_analysis_ttl(url, result)))
+    
+    def stop_writer(self):
+        """Finish the queued writes and stop the writer thread"""
+        with self.writer_lock:
+            if self.writer_thread is not None:
+                self.write_queue.put(None)
+                self.writer_thread.join(timeout=5)
+                self.writer_thread = None
+    
+    def _start_writer(self):
+        """Start the writer thread on first use"""
+        if self.writer_thread is None:
+            with self.writer_lock:
+                if self.writer_thread is None:
+                    self.writer_thread = threading.Thread(
+                        target=self._write_loop, name='cache-writer', daemon=True
+                    )
+                    self.writer_thread.start()
+    
+    def _write_loop(self):
+        """Serialize and store queued writes until stop_writer's sentinel"""
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                return
+            key, result, ttl = item
+            try:
+                self.cache.set_raw(key, _dumps(result), ttl)
+            except Exception as e:
+                logger.error(f"Cache writer error: {e}")
+    
+    def set_url_analyses(self, results: Dict[str, dict]):
+        """Cache many URL analysis results (TTLs as in set_url_analysis) in one round-trip"""
+        self.cache.mset([
+            (self._make_url_key(url), result, self._url_analysis_ttl(url, result))
+            for url, result in results.items()
+        ])
+    
+    def _url_analysis_ttl(self, url: str, result: dict) -> Optional[int]:
+        """TTL for a URL analysis result (None = permanent)"""
         # Determine TTL based on threat level
         threat_score = result.get('threat_score', 0)
         risk_level = result.get('risk_level', 'safe')
@@ -205,7 +388,7 @@ class ThreatCache:
             # Negative hits (safe)
             ttl = self.ttl_negative
         
-        self.cache.set(key, result, ttl)
+        return ttl
     
     def get_threat_intel(self, source: str, identifier: str) -> Optional[dict]:
         """Get cached threat intelligence result"""
@@ -221,13 +404,12 @@ class ThreatCache:
     
     def _make_url_key(self, url: str) -> str:
         """Generate cache key for URL"""
-        # Hash URL to create consistent key
-        url_hash = self._hash(url.lower().strip())
-        return f"url_analysis:{url_hash}"
+        # Memoized: the same URL is keyed for both the get and the set
+        return _url_key(url)
     
     def _hash(self, text: str) -> str:
-        """Generate hash of text"""
-        return hashlib.sha256(text.encode()).hexdigest()[:16]
+        """Generate hash of text (16 hex chars)"""
+        return _hash_text(text)
 
 
 # Global instances
@@ -0,0 +1,35 @@
+"""
+Domain Parts
+Memoized tldextract lookups against the bundled public suffix list
+"""
+from functools import lru_cache
+
+import tldextract
+from tldextract.remote import lenient_netloc
+from tldextract.tldextract import ExtractResult
+
+# Bundled suffix-list snapshot only: never fetch the list over the network
+# or write it to disk on first use
+_extractor = tldextract.TLDExtract(
+    suffix_list_urls=(),
+    cache_dir=None,
+    include_psl_private_domains=False
+)
+
+
+@lru_cache(maxsize=65536)
+def _extract_host(host: str) -> ExtractResult:
+    """Split a host into subdomain, domain and suffix"""
+    return _extractor(host)
+
+
+def extract(url: str) -> ExtractResult:
+    """Drop-in for tldextract.extract(url), cached per host"""
+    # Same lenient host parse tldextract applies before its suffix lookup,
+    # so results (including casing) match tldextract.extract exactly
+    host = lenient_netloc(url)
+    if host[-1:].isspace():
+        # Stripping the root label can expose whitespace that a second parse
+        # of the host would strip again; extract the URL as-is instead
+        return _extractor(url)
+    return _extract_host(host)
@@ -0,0 +1,40 @@
+"""
+Keyword Matching
+Single-pass multi-keyword search backed by an Aho-Corasick automaton
+"""
+from typing import Iterable, Set
+import logging
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordMatcher:
+    """Find which of a fixed set of keywords occur in a text"""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = frozenset(kw for kw in keywords if kw)
+        self._automaton = None
+
+        if AHOCORASICK_AVAILABLE and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+        elif not AHOCORASICK_AVAILABLE:
+            logger.debug("pyahocorasick not available, using substring scan")
+
+    def find(self, text: str) -> Set[str]:
+        """Return the set of keywords present in text (case-sensitive)"""
+        if self._automaton is not None:
+            return {keyword for _, keyword in self._automaton.iter(text)}
+        return {keyword for keyword in self.keywords if keyword in text}
+
+    def count(self, text: str) -> int:
+        """Return the number of distinct keywords present in text"""
+        return len(self.find(text))